@@ -0,0 +1,66 @@
+from datetime import date, datetime
+
+from sqlalchemy import func, insert, literal, null, select
+
+from app.database import session, User, VacationBalance, VacationEvent, AccrualPeriod, retry_on_locked, invalidate_all_users, current_actor
+from app.balance_history import take_balance_snapshots
+
+# First day of the month of a date
+def month_start(day):
+    return day.replace(day=1)
+
+# First day of the month `months` months later
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+# Function to get the last month that was credited (None if the accrual never ran)
+def last_accrual_period():
+    return session.query(func.max(AccrualPeriod.period)).scalar()
+
+# Months that still have to be credited up to `until` (included). Without any previous run the
+# catch-up starts at `since`, or at `until` itself (older months were topped up by hand).
+def pending_accrual_periods(until=None, since=None):
+    until = month_start(until or date.today())
+    last = last_accrual_period()
+    first = add_months(last, 1) if last else month_start(since or until)
+    return [add_months(first, i) for i in range(max((until.year - first.year) * 12 + until.month - first.month + 1, 0))]
+
+# Function to credit every user's monthly vacation days for all months not credited yet.
+# All missed months are credited together with one UPDATE per table, and the months are recorded
+# in the same transaction, so running it again never credits a month twice. One accrual event per
+# user and month goes to the event log, and a balance snapshot is taken afterwards.
+# Returns the credited months.
+@retry_on_locked
+def accrue_vacation_days(until=None, since=None):
+    months = pending_accrual_periods(until, since)
+    if not months:
+        session.rollback()
+        return []
+
+    credited = len(months)
+    accruing = User.monthly_vacation_days > 0
+    users = session.query(User).filter(accruing).update(
+        {User.vacation_days: User.vacation_days + User.monthly_vacation_days * credited},
+        synchronize_session=False,
+    )
+    monthly_days = select(User.monthly_vacation_days).where(User.id == VacationBalance.user_id).scalar_subquery()
+    session.query(VacationBalance).filter(
+        VacationBalance.user_id.in_(select(User.id).where(accruing))
+    ).update(
+        {VacationBalance.remaining_days: VacationBalance.remaining_days + monthly_days * credited},
+        synchronize_session=False,
+    )
+    now = datetime.now()
+    actor = current_actor()
+    for month in months:
+        session.execute(insert(VacationEvent).from_select(
+            ["at", "kind", "user_id", "actor_id", "start_date", "days_delta"],
+            select(literal(now), literal("accrual"), User.id, literal(actor) if actor is not None else null(), literal(month), User.monthly_vacation_days).where(accruing),
+        ))
+    session.add_all(AccrualPeriod(period=month, users=users) for month in months)
+    session.flush()
+    take_balance_snapshots()
+    session.commit()
+    invalidate_all_users()
+    return months
@@ -0,0 +1,29 @@
+import sys
+import os
+import argparse
+from datetime import datetime
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import init_db
+from app.accrual import accrue_vacation_days, pending_accrual_periods
+
+# Monatliche Urlaubstage gutschreiben (z.B. per cron am 1. des Monats); verpasste Monate werden nachgeholt
+def month(value):
+    return datetime.strptime(value, "%Y-%m").date()
+
+parser = argparse.ArgumentParser(description="Credit the monthly vacation days of every user for the months not credited yet.")
+parser.add_argument("--until", type=month, help="last month to credit (YYYY-MM, default: current month)")
+parser.add_argument("--since", type=month, help="first month to credit if the accrual never ran before (YYYY-MM, default: --until)")
+parser.add_argument("--dry-run", action="store_true", help="only show which months would be credited")
+args = parser.parse_args()
+
+init_db()
+if args.dry_run:
+    months = pending_accrual_periods(args.until, args.since)
+else:
+    months = accrue_vacation_days(args.until, args.since)
+
+for credited_month in months:
+    print(f"{'Would credit' if args.dry_run else 'Credited'} {credited_month:%Y-%m}")
+if not months:
+    print("Nothing to credit, all months are up to date.")
@@ -0,0 +1,199 @@
+import sys
+import os
+import json
+import hmac
+import argparse
+from datetime import date, time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import tornado.ioloop
+import tornado.web
+
+from app.database import init_db, initialize_settings, session, set_actor, get_settings, get_user_by_username, role_limit, max_occupancy
+from app.services import (
+    get_balances, check_vacation_limits, submit_vacations, approve_vacations, deny_vacations, delete_vacations,
+)
+
+# Local JSON API for the HR system and scripts (without Streamlit).
+# Every request sends the key from VACATION_MANAGER_API_KEY as "Authorization: Bearer <key>"; the server
+# refuses to start without a key unless --insecure is given. Writes also name the acting user in the
+# "X-Actor: <username>" header, which goes to the event log like the logged-in user of the app.
+API_KEY_VARIABLE = "VACATION_MANAGER_API_KEY"
+
+def _vacation_json(vacation):
+    return {
+        "id": vacation.id,
+        "user_id": vacation.user_id,
+        "start_date": vacation.start_date.isoformat(),
+        "end_date": vacation.end_date.isoformat(),
+        "start_time": vacation.start_time.isoformat() if vacation.start_time else None,
+        "end_time": vacation.end_time.isoformat() if vacation.end_time else None,
+        "status": vacation.status,
+        "note": vacation.note,
+    }
+
+# Parse one vacation request of a bulk submit (raises ValueError/KeyError/TypeError for bad input)
+def _parse_request(item):
+    return {
+        "user_id": int(item["user_id"]),
+        "start_date": date.fromisoformat(item["start_date"]),
+        "end_date": date.fromisoformat(item["end_date"]),
+        "start_time": time.fromisoformat(item["start_time"]) if item.get("start_time") else None,
+        "end_time": time.fromisoformat(item["end_time"]) if item.get("end_time") else None,
+        "note": item.get("note"),
+    }
+
+# Every request gets a fresh database session, like every Streamlit script run
+class ApiHandler(tornado.web.RequestHandler):
+    def prepare(self):
+        session.remove()
+        set_actor(None)
+        api_key = self.settings["api_key"]
+        if api_key and not hmac.compare_digest(self.request.headers.get("Authorization", "").encode(), f"Bearer {api_key}".encode()):
+            raise tornado.web.HTTPError(401, reason="missing or wrong API key")
+
+    def on_finish(self):
+        session.remove()
+
+    def write_error(self, status_code, **kwargs):
+        self.finish({"error": self._reason})
+
+    # JSON body of the request
+    def body(self):
+        try:
+            return json.loads(self.request.body or b"{}")
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="body is not valid JSON")
+
+    # User named in the X-Actor header; becomes the actor of the logged events. Admin rights are needed unless admin=False.
+    def actor(self, admin=True):
+        username = self.request.headers.get("X-Actor")
+        user = get_user_by_username(username) if username else None
+        if user is None:
+            raise tornado.web.HTTPError(403, reason="X-Actor must name an existing user")
+        if admin and user.role != 'Admin':
+            raise tornado.web.HTTPError(403, reason="only admins can do this")
+        set_actor(user.id)
+        return user
+
+    # List of integer ids from the body (e.g. {"ids": [1, 2, 3]})
+    def ids(self, field="ids"):
+        try:
+            return [int(value) for value in self.body()[field]]
+        except (KeyError, TypeError, ValueError):
+            raise tornado.web.HTTPError(400, reason=f"expected a list of integers in '{field}'")
+
+# GET /api/balances?user_id=1&user_id=2 or POST /api/balances {"user_ids": [...]}
+class BalancesHandler(ApiHandler):
+    def get(self):
+        try:
+            user_ids = [int(value) for value in self.get_query_arguments("user_id")]
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="user_id must be an integer")
+        self.write_balances(user_ids)
+
+    def post(self):
+        self.write_balances(self.ids("user_ids"))
+
+    def write_balances(self, user_ids):
+        self.write({"balances": [
+            {
+                "user_id": user.id,
+                "username": user.username,
+                "role": user.role,
+                "vacation_days": user.vacation_days,
+                "used_days": balance.used_days,
+                "remaining_days": balance.remaining_days,
+            }
+            for user, balance in get_balances(user_ids)
+        ]})
+
+# GET /api/limits?role=Tourneur&start_date=2024-07-01&end_date=2024-07-14
+class LimitsHandler(ApiHandler):
+    def get(self):
+        role = self.get_query_argument("role")
+        try:
+            start_date = date.fromisoformat(self.get_query_argument("start_date"))
+            end_date = date.fromisoformat(self.get_query_argument("end_date"))
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="dates must be YYYY-MM-DD")
+        self.write({
+            "role": role,
+            "allowed": check_vacation_limits(role, start_date, end_date),
+            "limit": role_limit(get_settings(), role),
+            "max_occupancy": max_occupancy(role, start_date, end_date),
+        })
+
+# POST /api/vacations {"requests": [{"user_id": 1, "start_date": "...", "end_date": "...", ...}, ...]}
+class SubmitHandler(ApiHandler):
+    def post(self):
+        actor = self.actor(admin=False)
+        items = self.body().get("requests")
+        if not isinstance(items, list):
+            raise tornado.web.HTTPError(400, reason="expected a list in 'requests'")
+        if actor.role != 'Admin' and any(not isinstance(item, dict) or str(item.get("user_id")) != str(actor.id) for item in items):
+            raise tornado.web.HTTPError(403, reason="only admins can submit requests for other users")
+
+        requests, positions, rejected = [], [], []
+        for index, item in enumerate(items):
+            try:
+                requests.append(_parse_request(item))
+                positions.append(index)
+            except (KeyError, TypeError, ValueError, AttributeError):
+                rejected.append((index, "user_id, start_date and end_date are required (dates YYYY-MM-DD, times HH:MM)"))
+
+        created, errors = submit_vacations(requests) if requests else ([], [])
+        rejected += [(positions[index], error) for index, error in errors]
+        self.write({
+            "created": [_vacation_json(vacation) for vacation in created],
+            "rejected": [{"index": index, "error": error} for index, error in sorted(rejected)],
+        })
+
+# POST /api/vacations/approve {"ids": [...]}
+class ApproveHandler(ApiHandler):
+    def post(self):
+        self.actor()
+        approved, blocked = approve_vacations(self.ids())
+        self.write({
+            "approved": [vacation.id for vacation in approved],
+            "blocked": [{"id": vacation.id, "day": day.isoformat(), "role": vacation.user.role} for vacation, day in blocked],
+        })
+
+# POST /api/vacations/deny {"ids": [...]}
+class DenyHandler(ApiHandler):
+    def post(self):
+        self.actor()
+        self.write({"denied": [vacation.id for vacation in deny_vacations(self.ids())]})
+
+# POST /api/vacations/delete {"ids": [...]}
+class DeleteHandler(ApiHandler):
+    def post(self):
+        self.actor()
+        self.write({"deleted": delete_vacations(self.ids())})
+
+def make_app(api_key):
+    return tornado.web.Application([
+        (r"/api/balances", BalancesHandler),
+        (r"/api/limits", LimitsHandler),
+        (r"/api/vacations", SubmitHandler),
+        (r"/api/vacations/approve", ApproveHandler),
+        (r"/api/vacations/deny", DenyHandler),
+        (r"/api/vacations/delete", DeleteHandler),
+    ], api_key=api_key)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the vacation manager JSON API.")
+    parser.add_argument("--address", default="127.0.0.1", help="address to listen on (default: only local connections)")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--insecure", action="store_true", help=f"serve without an API key when {API_KEY_VARIABLE} is not set")
+    args = parser.parse_args()
+
+    api_key = os.environ.get(API_KEY_VARIABLE)
+    if not api_key and not args.insecure:
+        parser.error(f"set {API_KEY_VARIABLE} (or pass --insecure to serve without a key)")
+
+    init_db()
+    initialize_settings()
+    make_app(api_key).listen(args.port, address=args.address)
+    print(f"Vacation manager API listening on http://{args.address}:{args.port}/api" + ("" if api_key else " WITHOUT an API key"))
+    tornado.ioloop.IOLoop.current().start()
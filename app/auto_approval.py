@@ -0,0 +1,41 @@
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+
+from app.database import session, User, Vacation, get_balance, plan_approvals, change_vacation, retry_on_locked
+
+# Orders in which the pending queue is processed (first come, first served by default)
+PRIORITIES = {
+    "submission": (Vacation.id,),
+    "start_date": (Vacation.start_date, Vacation.id),
+    "shortest": (func.julianday(Vacation.end_date) - func.julianday(Vacation.start_date), Vacation.id),
+}
+
+# Function to plan the approval of the whole pending queue without changing anything.
+# Greedy in priority order: a request is approved when every day fits the role limit and the
+# days fit in what is left of the user's balance after the requests approved before it.
+# Returns (vacations to approve, [(vacation, blocking day or None for the balance), ...]).
+def plan_pending_approvals(priority="submission"):
+    pending = (
+        session.query(Vacation)
+        .options(joinedload(Vacation.user).joinedload(User.balance))
+        .filter(Vacation.status == 'pending', Vacation.user_id.isnot(None))
+        .order_by(*PRIORITIES[priority])
+        .all()
+    )
+    remaining = {}
+    for vacation in pending:
+        user = vacation.user
+        if user.id not in remaining:
+            remaining[user.id] = (user.balance or get_balance(user)).remaining_days
+    return plan_approvals(pending, remaining)
+
+# Function to approve everything that fits in one transaction; with dry_run only the plan is returned
+@retry_on_locked
+def auto_approve(priority="submission", dry_run=False):
+    accepted, blocked = plan_pending_approvals(priority)
+    if dry_run:
+        return accepted, blocked
+    for vacation in accepted:
+        change_vacation(vacation, status='approved')
+    session.commit()
+    return accepted, blocked
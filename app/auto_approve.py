@@ -0,0 +1,33 @@
+import sys
+import os
+import time
+import argparse
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import init_db, initialize_settings, session
+from app.auto_approval import PRIORITIES, auto_approve
+
+# Offene Urlaubsanträge automatisch genehmigen, soweit Rollenlimits und Resturlaub es erlauben.
+# Einmalig (z.B. per cron) oder mit --every als dauerhaft laufender Job.
+parser = argparse.ArgumentParser(description="Approve the pending vacation requests that fit the role limits and balances.")
+parser.add_argument("--priority", choices=sorted(PRIORITIES), default="submission", help="order in which the pending queue is processed")
+parser.add_argument("--dry-run", action="store_true", help="only show what would be approved")
+parser.add_argument("--every", type=int, metavar="MINUTES", help="run again every MINUTES minutes")
+args = parser.parse_args()
+
+init_db()
+initialize_settings()
+while True:
+    accepted, blocked = auto_approve(args.priority, dry_run=args.dry_run)
+    verb = "Would approve" if args.dry_run else "Approved"
+    for vacation in accepted:
+        print(f"{verb} {vacation.user.username}: {vacation.start_date} - {vacation.end_date}")
+    for vacation, day in blocked:
+        reason = "not enough remaining days" if day is None else f"limit for {vacation.user.role} reached on {day}"
+        print(f"Kept pending {vacation.user.username}: {vacation.start_date} - {vacation.end_date} ({reason})")
+    print(f"{len(accepted)} approved, {len(blocked)} still pending.")
+    session.remove()
+
+    if args.every is None:
+        break
+    time.sleep(args.every * 60)
@@ -0,0 +1,79 @@
+from datetime import datetime
+
+from sqlalchemy import func, insert, literal, or_, select
+
+from app.database import session, User, VacationBalance, VacationEvent, BalanceSnapshot, retry_on_locked
+
+# Function to store the current balance of every user as a snapshot, in one INSERT ... SELECT.
+# A snapshot records the user's last event it includes; users without an event of their own since
+# their last snapshot are skipped.
+def take_balance_snapshots():
+    last_event = (
+        select(VacationEvent.user_id, func.max(VacationEvent.id).label("event_id"))
+        .group_by(VacationEvent.user_id)
+        .subquery()
+    )
+    last_snapshot = (
+        select(BalanceSnapshot.user_id, func.max(BalanceSnapshot.event_id).label("event_id"))
+        .group_by(BalanceSnapshot.user_id)
+        .subquery()
+    )
+    event_id = func.coalesce(last_event.c.event_id, 0)
+    rows = (
+        select(
+            User.id,
+            event_id,
+            literal(datetime.now()),
+            func.coalesce(User.vacation_days, 0.0),
+            func.coalesce(VacationBalance.used_days, 0.0),
+        )
+        .outerjoin(VacationBalance, VacationBalance.user_id == User.id)
+        .outerjoin(last_event, last_event.c.user_id == User.id)
+        .outerjoin(last_snapshot, last_snapshot.c.user_id == User.id)
+        .where(or_(last_snapshot.c.user_id.is_(None), event_id > last_snapshot.c.event_id))
+    )
+    result = session.execute(
+        insert(BalanceSnapshot)
+        .from_select(["user_id", "event_id", "taken_at", "vacation_days", "used_days"], rows)
+        .prefix_with("OR IGNORE")
+    )
+    return result.rowcount
+
+# Function to take the periodic snapshots in their own transaction; returns the number of users snapshotted
+@retry_on_locked
+def snapshot_balances():
+    count = take_balance_snapshots()
+    session.commit()
+    return count
+
+# Function to get the balance of a user at a point in time: the nearest snapshot before it plus the events after it.
+# Returns (vacation days, used days, remaining days).
+def balance_as_of(user_id, moment):
+    snapshot = (
+        session.query(BalanceSnapshot)
+        .filter(BalanceSnapshot.user_id == user_id, BalanceSnapshot.taken_at <= moment)
+        .order_by(BalanceSnapshot.taken_at.desc(), BalanceSnapshot.event_id.desc())
+        .first()
+    )
+    vacation_days = snapshot.vacation_days if snapshot else 0.0
+    used_days = snapshot.used_days if snapshot else 0.0
+
+    days_delta, used_delta = session.query(
+        func.coalesce(func.sum(VacationEvent.days_delta), 0.0),
+        func.coalesce(func.sum(VacationEvent.used_delta), 0.0),
+    ).filter(
+        VacationEvent.user_id == user_id,
+        VacationEvent.id > (snapshot.event_id if snapshot else 0),
+        VacationEvent.at <= moment,
+    ).one()
+
+    vacation_days += days_delta
+    used_days += used_delta
+    return vacation_days, used_days, vacation_days - used_days
+
+# Function to load the newest events, optionally of one user
+def load_events(user_id=None, limit=200):
+    query = session.query(VacationEvent).order_by(VacationEvent.id.desc())
+    if user_id is not None:
+        query = query.filter(VacationEvent.user_id == user_id)
+    return query.limit(limit).all()
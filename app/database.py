@@ -1,11 +1,62 @@
-from sqlalchemy import create_engine, Column, Integer, String, Date, Time, ForeignKey, func
+import functools
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, event, Column, Index, Integer, String, Date, DateTime, Time, ForeignKey, Float, func, and_, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, scoped_session, relationship, joinedload, contains_eager
+
+import numpy as np
+from cachetools import TTLCache
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+from app.instrumentation import record_query
+from app.vacation_days import calculate_vacation_days, calculate_vacation_days_batch
+from app.work_calendar import WorkCalendar, Shift
+
+# Can be pointed at another file, e.g. a scratch database for benchmarks
+DATABASE_URL = os.environ.get("VACATION_MANAGER_DATABASE_URL", "sqlite:///vacation_manager.db")
+
+# Shared by all Streamlit script threads, so the pool is sized for many concurrent users
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False, "timeout": 5},
+    pool_size=10,
+    max_overflow=20,
+    pool_timeout=30,
+)
+
+# WAL lets readers and the single writer work at the same time; NORMAL is durable enough with WAL
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+# Count and time every statement for the rerun diagnostics
+@event.listens_for(engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
 
-DATABASE_URL = "sqlite:///vacation_manager.db"
+@event.listens_for(engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    record_query(statement, (time.perf_counter() - started) * 1000)
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+@event.listens_for(engine, "handle_error")
+def _handle_error(exception_context):
+    query_started = exception_context.connection.info.get("query_started") if exception_context.connection is not None else None
+    if query_started:
+        query_started.pop()
+
+# Objects stay readable after commit, e.g. the logged-in user kept in st.session_state
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 Base = declarative_base()
 
 class User(Base):
@@ -18,7 +69,21 @@ class User(Base):
     vacation_days = Column(Integer, default=0)
     role = Column(String)
     monthly_vacation_days = Column(Integer, default=2)
+    # Part of every session token; raising it (logout) revokes all tokens issued before
+    token_version = Column(Integer, default=0, nullable=False, server_default="0")
     vacations = relationship("Vacation", back_populates="user")
+    balance = relationship("VacationBalance", back_populates="user", uselist=False)
+
+
+# Laufender Urlaubssaldo pro Benutzer, wird zusammen mit jeder Änderung an Urlauben gepflegt
+class VacationBalance(Base):
+    __tablename__ = 'vacation_balances'
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    used_days = Column(Float, default=0.0)
+    remaining_days = Column(Float, default=0.0)
+
+    user = relationship("User", back_populates="balance")
 
 
 class Vacation(Base):
@@ -38,6 +103,18 @@ class Vacation(Base):
     user_id = Column(Integer, ForeignKey('users.id'))
     user = relationship("User", back_populates="vacations")
 
+    __table_args__ = (
+        Index('ix_vacations_status_start_date', 'status', 'start_date'),
+        Index('ix_vacations_user_id', 'user_id'),
+        Index('ix_vacations_user_dates', 'user_id', 'start_date', 'end_date'),
+    )
+
+# Roles a user can have
+ROLES = ("Tourneur", "Fraiseur", "Soudeur", "Admin")
+
+# Statuses of vacations an admin has already decided on
+PROCESSED_STATUSES = ('approved', 'denied')
+
 class Settings(Base):
     __tablename__ = "settings"
     
@@ -46,7 +123,572 @@ class Settings(Base):
     fraeser_limit = Column(Integer, default=2)
     schweisser_limit = Column(Integer, default=2)
 
+
+# Anzahl genehmigter Abwesenheiten pro Tag und Rolle (für die Limitprüfung)
+class RoleOccupancy(Base):
+    __tablename__ = "role_occupancy"
+
+    # Primärschlüssel (role, day) dient gleichzeitig als Index für Bereichsabfragen
+    role = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    headcount = Column(Integer, default=0, nullable=False)
+
+# Arbeitsfreie Wochentage (date.weekday(): 0 = Montag ... 6 = Sonntag)
+class WeekendDay(Base):
+    __tablename__ = "weekend_days"
+
+    weekday = Column(Integer, primary_key=True)
+
+
+# Feiertage, zählen nicht als Urlaubstage
+class Holiday(Base):
+    __tablename__ = "holidays"
+
+    day = Column(Date, primary_key=True)
+    name = Column(String)
+
+
+# Arbeitszeit pro Rolle; Rollen ohne Eintrag arbeiten 7:30-16:00 mit Mittagspause 12:00-12:30
+class RoleShift(Base):
+    __tablename__ = "role_shifts"
+
+    role = Column(String, primary_key=True)
+    start_time = Column(Time, nullable=False)
+    end_time = Column(Time, nullable=False)
+    lunch_start = Column(Time, nullable=False)
+    lunch_end = Column(Time, nullable=False)
+
+# Bereits gutgeschriebene Monate (erster Tag des Monats), damit kein Monat doppelt gutgeschrieben wird
+class AccrualPeriod(Base):
+    __tablename__ = "accrual_periods"
+
+    period = Column(Date, primary_key=True)
+    users = Column(Integer, default=0)
+
+# Protokoll aller Änderungen an Urlauben und Salden (nur anhängen, nie ändern oder löschen).
+# used_delta/days_delta sind die Änderung der genommenen bzw. zustehenden Tage durch das Ereignis.
+class VacationEvent(Base):
+    __tablename__ = "vacation_events"
+
+    id = Column(Integer, primary_key=True)
+    at = Column(DateTime, nullable=False)
+    kind = Column(String, nullable=False)  # create, approve, deny, edit, delete, accrual, adjust
+    user_id = Column(Integer, nullable=False)  # no foreign key: the history outlives deleted users and vacations
+    actor_id = Column(Integer, nullable=True)
+    vacation_id = Column(Integer, nullable=True)
+    start_date = Column(Date, nullable=True)
+    end_date = Column(Date, nullable=True)
+    start_time = Column(Time, nullable=True)
+    end_time = Column(Time, nullable=True)
+    status = Column(String, nullable=True)
+    used_delta = Column(Float, default=0.0, nullable=False)
+    days_delta = Column(Float, default=0.0, nullable=False)
+
+    __table_args__ = (
+        Index('ix_vacation_events_user_id_id', 'user_id', 'id'),
+        Index('ix_vacation_events_at', 'at'),
+    )
+
+
+# Stand des Saldos eines Benutzers nach dem Ereignis event_id (Ausgangspunkt für historische Abfragen)
+class BalanceSnapshot(Base):
+    __tablename__ = "balance_snapshots"
+
+    user_id = Column(Integer, primary_key=True)
+    event_id = Column(Integer, primary_key=True)
+    taken_at = Column(DateTime, nullable=False)
+    vacation_days = Column(Float, nullable=False)
+    used_days = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index('ix_balance_snapshots_user_id_taken_at', 'user_id', 'taken_at'),
+    )
+
+# Change counter of each user's vacations. SQLite triggers raise it on every insert, update and delete
+# in the vacations table, so changes from any process (API, CLI scripts) are seen by the overlap index.
+class VacationGeneration(Base):
+    __tablename__ = "vacation_generations"
+
+    user_id = Column(Integer, primary_key=True)
+    generation = Column(Integer, nullable=False, default=0)
+
+# Function to create or upgrade the schema (see app/migrations.py)
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    from app.migrations import migrate  # migrations need the models defined in this module
+    return migrate()
+
+# One session per thread (i.e. per Streamlit script run); call session.remove() when a run starts/ends
+session = scoped_session(SessionLocal)
+
+def _is_database_locked(exception):
+    return isinstance(exception, OperationalError) and "database is locked" in str(exception)
+
+# Decorator for write functions: on 'database is locked' roll back and run the whole function again
+def retry_on_locked(func):
+    @retry(
+        retry=retry_if_exception(_is_database_locked),
+        stop=stop_after_attempt(5),
+        wait=wait_random_exponential(multiplier=0.05, max=1),
+        before_sleep=lambda retry_state: session.rollback(),
+        reraise=True,
+    )
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return func(*args, **kwargs)
+    return wrapper
+
+# Id of the user making the current changes (per thread, like the session); stored with every event
+_actor = threading.local()
+
+def set_actor(user_id):
+    _actor.user_id = user_id
+
+def current_actor():
+    return getattr(_actor, "user_id", None)
+
+# Function to append an event to the log; runs in the caller's transaction
+def log_event(kind, user_id, vacation=None, used_delta=0.0, days_delta=0.0):
+    event = VacationEvent(at=datetime.now(), kind=kind, user_id=user_id, actor_id=current_actor(), used_delta=used_delta, days_delta=days_delta)
+    if vacation is not None:
+        event.vacation_id = vacation.id
+        event.start_date = vacation.start_date
+        event.end_date = vacation.end_date
+        event.start_time = vacation.start_time
+        event.end_time = vacation.end_time
+        event.status = vacation.status
+    session.add(event)
+
+# Small thread-safe read-through cache with TTL, size-bounded (LRU) eviction and hit/miss counters
+class ReadThroughCache:
+    def __init__(self, maxsize, ttl):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # Return the cached value for key, or call load() and cache its result (None is not cached)
+    def get(self, key, load):
+        with self._lock:
+            if key in self._cache:
+                self.hits += 1
+                return self._cache[key]
+            self.misses += 1
+        value = load()
+        if value is not None:
+            with self._lock:
+                self._cache[key] = value
+        return value
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._cache.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._cache), "maxsize": self._cache.maxsize}
+
+
+# Settings and users almost never change; admin writes invalidate the entries
+settings_cache = ReadThroughCache(maxsize=1, ttl=300)
+calendar_cache = ReadThroughCache(maxsize=1, ttl=300)
+user_cache = ReadThroughCache(maxsize=2048, ttl=120)
+
+# Load an object in its own short session, so the cached copy is detached and never part of a later transaction
+def _load_detached(load):
+    with SessionLocal() as cache_session:
+        return load(cache_session)
+
+# Function to create the settings row with the default limits if it does not exist yet
+def initialize_settings():
+    if session.query(Settings.id).first() is None:
+        session.add(Settings(dreher_limit=2, fraeser_limit=2, schweisser_limit=2))
+        session.commit()
+        invalidate_settings()
+
+# Function to get the settings (cached, read-only copy)
+def get_settings():
+    return settings_cache.get("settings", lambda: _load_detached(lambda s: s.query(Settings).first()))
+
+# Function to drop the cached settings after they were changed
+def invalidate_settings():
+    settings_cache.clear()
+
+# Function to load the working-day calendar (weekends, holidays and shifts) from the database
+def _load_calendar(cache_session):
+    try:
+        weekend = [row.weekday for row in cache_session.query(WeekendDay.weekday)]
+        holidays = [row.day for row in cache_session.query(Holiday.day)]
+        shifts = {
+            row.role: Shift(row.start_time, row.end_time, row.lunch_start, row.lunch_end)
+            for row in cache_session.query(RoleShift)
+        }
+    except OperationalError:
+        return WorkCalendar()  # Calendar tables not created yet (database older than migration 5)
+    return WorkCalendar(weekend, holidays, shifts)
+
+# Function to get the working-day calendar (cached; the prefix sums are built once per load)
+def get_calendar():
+    return calendar_cache.get("calendar", lambda: _load_detached(_load_calendar))
+
+# Function to drop the cached calendar after weekends, holidays or shifts were changed
+def invalidate_calendar():
+    calendar_cache.clear()
+
+# Function to get a user by id (cached, read-only copy)
+def get_user(user_id):
+    return user_cache.get(("id", user_id), lambda: _load_detached(lambda s: s.get(User, user_id)))
+
+# Function to get a user by username (cached, read-only copy)
+def get_user_by_username(username):
+    return user_cache.get(("username", username), lambda: _load_detached(lambda s: s.query(User).filter_by(username=username).first()))
+
+# Function to drop the cached copies of a user after they were changed or deleted
+def invalidate_user(user_id, username):
+    user_cache.invalidate(("id", user_id), ("username", username))
+
+# Function to drop the cached copies of all users (after a change to every user, e.g. the monthly accrual)
+def invalidate_all_users():
+    user_cache.clear()
+
+# Hit/miss counters of all caches
+def cache_stats():
+    return {"settings": settings_cache.stats(), "calendar": calendar_cache.stats(), "users": user_cache.stats()}
+
+# Number of days a vacation takes from the balance (only approved vacations count)
+def vacation_used_days(vacation):
+    if vacation.status != 'approved':
+        return 0.0
+    role = vacation.user.role if vacation.user else None
+    return calculate_vacation_days(vacation.start_date, vacation.end_date, vacation.start_time, vacation.end_time, get_calendar(), role)
+
+# Function to compute the used days per user from the vacations table in one batch
+def compute_used_days_by_user(user_id=None):
+    query = session.query(
+        Vacation.user_id, User.role, Vacation.start_date, Vacation.end_date, Vacation.start_time, Vacation.end_time
+    ).join(User, Vacation.user_id == User.id).filter(Vacation.status == 'approved')
+    if user_id is not None:
+        query = query.filter(Vacation.user_id == user_id)
+    rows = query.all()
+    if not rows:
+        return {}
+
+    user_ids, roles, start_dates, end_dates, start_times, end_times = zip(*rows)
+    days = calculate_vacation_days_batch(start_dates, end_dates, start_times, end_times, get_calendar(), roles)
+    unique_ids, positions = np.unique(np.array(user_ids), return_inverse=True)
+    totals = np.bincount(positions, weights=days)
+    return dict(zip(unique_ids.tolist(), totals.tolist()))
+
+# Function to compute the used days of a user from the vacations table
+def compute_used_days(user_id):
+    return compute_used_days_by_user(user_id).get(user_id, 0.0)
+
+# Function to get the balance row of a user, creating it from the vacations table if it is missing
+def get_balance(user):
+    balance = session.get(VacationBalance, user.id)
+    if balance is None:
+        session.flush()
+        used_days = compute_used_days(user.id)
+        balance = VacationBalance(user_id=user.id, used_days=used_days, remaining_days=user.vacation_days - used_days)
+        session.add(balance)
+        session.flush()
+    return balance
+
+# Function to add (or remove) used days on the balance; runs in the caller's transaction
+def adjust_used_days(user_id, delta):
+    if not delta:
+        return
+    updated = session.query(VacationBalance).filter_by(user_id=user_id).update(
+        {
+            VacationBalance.used_days: VacationBalance.used_days + delta,
+            VacationBalance.remaining_days: VacationBalance.remaining_days - delta,
+        },
+        synchronize_session='fetch',
+    )
+    if not updated:
+        # No ledger row yet: build it from the vacations table, which already contains this change
+        user = session.get(User, user_id)
+        if user is not None:
+            get_balance(user)
+
+# (role, start_date, end_date) a vacation occupies, or None if it does not count towards the limits
+def occupancy_span(vacation):
+    if vacation.status != 'approved' or vacation.user is None:
+        return None
+    return (vacation.user.role, vacation.start_date, vacation.end_date)
+
+# Function to add (or remove) one person per day of a span to the occupancy table
+def adjust_occupancy(span, delta):
+    if span is None:
+        return
+    role, start_date, end_date = span
+    days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+    if not days:
+        return
+
+    stmt = sqlite_insert(RoleOccupancy.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['role', 'day'],
+        set_={'headcount': RoleOccupancy.__table__.c.headcount + stmt.excluded.headcount},
+    )
+    session.execute(stmt, [{'role': role, 'day': day, 'headcount': delta} for day in days])
+    if delta < 0:
+        session.query(RoleOccupancy).filter(
+            RoleOccupancy.role == role,
+            RoleOccupancy.day >= start_date,
+            RoleOccupancy.day <= end_date,
+            RoleOccupancy.headcount <= 0,
+        ).delete(synchronize_session=False)
+
+# Function to get the highest number of approved absences on any day of a range for a role
+def max_occupancy(role, start_date, end_date):
+    headcount = session.query(func.max(RoleOccupancy.headcount)).filter(
+        RoleOccupancy.role == role,
+        RoleOccupancy.day >= start_date,
+        RoleOccupancy.day <= end_date,
+    ).scalar()
+    return headcount or 0
+
+# Limit of a role from the settings (None means the role has no limit)
+def role_limit(settings, role):
+    return {'Tourneur': settings.dreher_limit, 'Fraiseur': settings.fraeser_limit, 'Soudeur': settings.schweisser_limit}.get(role)
+
+# Function to check a set of vacations against the role limits in one pass, in the given order.
+# Each vacation that fits is counted before the next one is checked.
+# With remaining ({user id: remaining days}) the vacation must also fit in what is left of the user's balance.
+# Returns (vacations that fit, [(vacation, first day over the limit), ...] for the others);
+# the day is None when the balance was the blocker.
+def plan_approvals(vacations, remaining=None):
+    settings = get_settings()
+    spans = [(vacation, vacation.user.role if vacation.user else None) for vacation in vacations]
+    limited = [(vacation, role) for vacation, role in spans if role_limit(settings, role) is not None]
+
+    # Current headcount of every (role, day) the set touches, in one query
+    headcount = {}
+    if limited:
+        rows = session.query(RoleOccupancy.role, RoleOccupancy.day, RoleOccupancy.headcount).filter(
+            RoleOccupancy.role.in_({role for _, role in limited}),
+            RoleOccupancy.day >= min(vacation.start_date for vacation, _ in limited),
+            RoleOccupancy.day <= max(vacation.end_date for vacation, _ in limited),
+        )
+        headcount = {(role, day): count for role, day, count in rows}
+
+    if remaining is not None:
+        remaining = dict(remaining)
+        day_counts = calculate_vacation_days_batch(
+            [vacation.start_date for vacation in vacations],
+            [vacation.end_date for vacation in vacations],
+            [vacation.start_time for vacation in vacations],
+            [vacation.end_time for vacation in vacations],
+            get_calendar(),
+            [role for _, role in spans],
+        ) if vacations else []
+
+    accepted, blocked = [], []
+    for index, (vacation, role) in enumerate(spans):
+        limit = role_limit(settings, role)
+        days = [vacation.start_date + timedelta(days=i) for i in range((vacation.end_date - vacation.start_date).days + 1)]
+        full_day = None if limit is None else next((day for day in days if headcount.get((role, day), 0) >= limit), None)
+        if full_day is not None:
+            blocked.append((vacation, full_day))
+            continue
+        if remaining is not None:
+            needed = float(day_counts[index])
+            if needed > remaining.get(vacation.user_id, 0.0) + 1e-9:
+                blocked.append((vacation, None))
+                continue
+            remaining[vacation.user_id] = remaining.get(vacation.user_id, 0.0) - needed
+        accepted.append(vacation)
+        if limit is not None:
+            for day in days:
+                headcount[(role, day)] = headcount.get((role, day), 0) + 1
+    return accepted, blocked
+
+# Function to rebuild the occupancy table from all approved vacations
+def rebuild_occupancy():
+    rows = session.query(User.role, Vacation.start_date, Vacation.end_date).join(User).filter(
+        Vacation.status == 'approved'
+    ).all()
+    session.query(RoleOccupancy).delete(synchronize_session=False)
+
+    if rows:
+        roles, start_dates, end_dates = zip(*rows)
+        role_names, role_codes = np.unique(np.array(roles, dtype=object).astype(str), return_inverse=True)
+        starts = np.array(start_dates, dtype='datetime64[D]').astype(np.int64)
+        lengths = np.maximum(np.array(end_dates, dtype='datetime64[D]').astype(np.int64) - starts + 1, 0)
+
+        # Expand every vacation into its days, then count (role, day) pairs
+        day_numbers = np.repeat(starts, lengths) + (np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths))
+        pairs, headcounts = np.unique(np.stack([np.repeat(role_codes, lengths), day_numbers], axis=1), axis=0, return_counts=True)
+
+        session.execute(RoleOccupancy.__table__.insert(), [
+            {'role': role_names[role_code], 'day': day.astype('datetime64[D]').item(), 'headcount': int(headcount)}
+            for (role_code, day), headcount in zip(pairs, headcounts)
+        ])
+    session.commit()
+
+# Function to create a vacation request
+def create_vacation(**fields):
+    vacation = Vacation(status='pending', **fields)
+    session.add(vacation)
+    session.flush()
+    log_event('create', vacation.user_id, vacation)
+    return vacation
+
+# Event kind of a status change
+STATUS_EVENTS = {'approved': 'approve', 'denied': 'deny'}
+
+# Function to change the fields of a vacation and keep the balance, occupancy and event log in step
+def change_vacation(vacation, **changes):
+    changes = {field: value for field, value in changes.items() if getattr(vacation, field) != value}
+    if not changes:
+        return  # nothing changed: no balance update and no event
+    used_before = vacation_used_days(vacation)
+    span_before = occupancy_span(vacation)
+    status_before = vacation.status
+    for field, value in changes.items():
+        setattr(vacation, field, value)
+    used_delta = vacation_used_days(vacation) - used_before
+    adjust_used_days(vacation.user_id, used_delta)
+    kind = STATUS_EVENTS.get(vacation.status, 'edit') if vacation.status != status_before else 'edit'
+    log_event(kind, vacation.user_id, vacation, used_delta=used_delta)
+
+    span_after = occupancy_span(vacation)
+    if span_after != span_before:
+        adjust_occupancy(span_before, -1)
+        adjust_occupancy(span_after, 1)
+
+# Function to delete a vacation and give its days back to the balance and occupancy
+def remove_vacation(vacation_id):
+    vacation = session.get(Vacation, vacation_id)
+    if vacation is None:
+        return
+    used_before = vacation_used_days(vacation)
+    span_before = occupancy_span(vacation)
+    session.delete(vacation)
+    adjust_used_days(vacation.user_id, -used_before)
+    log_event('delete', vacation.user_id, vacation, used_delta=-used_before)
+    adjust_occupancy(span_before, -1)
+
+# Function to change the role of a user and move their approved vacations to the new role
+def change_user_role(user, new_role):
+    if user.role == new_role:
+        return
+    session.flush()
+    approved_vacations = session.query(Vacation).filter_by(user_id=user.id, status='approved').all()
+    used_before = compute_used_days(user.id)
+    for vacation in approved_vacations:
+        adjust_occupancy(occupancy_span(vacation), -1)
+    user.role = new_role
+    for vacation in approved_vacations:
+        adjust_occupancy(occupancy_span(vacation), 1)
+
+    # The new role may work another shift, which changes how many days the vacations take
+    session.flush()
+    used_delta = compute_used_days(user.id) - used_before
+    adjust_used_days(user.id, used_delta)
+    if used_delta:
+        log_event('adjust', user.id, used_delta=used_delta)
+
+# Function to delete a user together with their balance and occupancy
+def delete_user(user_id):
+    session.flush()
+    approved_vacations = session.query(Vacation).filter_by(user_id=user_id, status='approved').all()
+    for vacation in approved_vacations:
+        adjust_occupancy(occupancy_span(vacation), -1)
+    session.query(VacationBalance).filter_by(user_id=user_id).delete()
+    session.query(User).filter_by(id=user_id).delete()
+
+# Function to set the total vacation days of a user and update the remaining days
+def set_vacation_days(user, vacation_days):
+    days_delta = vacation_days - user.vacation_days
+    user.vacation_days = vacation_days
+    if days_delta:
+        log_event('adjust', user.id, days_delta=days_delta)
+    balance = get_balance(user)
+    balance.remaining_days = vacation_days - balance.used_days
+
+# Function to rebuild all balances from the vacations table; returns the users whose stored balance drifted.
+# Corrections are logged as events (record=False for migrations that run before the event log exists).
+def reconcile_balances(fix=True, record=True):
+    used_by_user = compute_used_days_by_user()
+
+    balances = {balance.user_id: balance for balance in session.query(VacationBalance)}
+    drift = []
+    for user in session.query(User):
+        used_days = used_by_user.get(user.id, 0.0)
+        remaining_days = user.vacation_days - used_days
+        balance = balances.get(user.id)
+        if balance is None:
+            drift.append((user.username, None, used_days))
+            if fix:
+                session.add(VacationBalance(user_id=user.id, used_days=used_days, remaining_days=remaining_days))
+                if record and used_days:
+                    log_event('adjust', user.id, used_delta=used_days)
+        elif abs(balance.used_days - used_days) > 1e-6 or abs(balance.remaining_days - remaining_days) > 1e-6:
+            drift.append((user.username, balance.used_days, used_days))
+            if fix:
+                if record and abs(balance.used_days - used_days) > 1e-6:
+                    log_event('adjust', user.id, used_delta=used_days - balance.used_days)
+                balance.used_days = used_days
+                balance.remaining_days = remaining_days
+
+    if fix:
+        session.commit()
+    else:
+        session.rollback()
+    return drift
+
+# Function to load the pending vacation requests with their requester and balance in a constant number of queries
+def load_vacation_requests():
+    pending = (
+        session.query(Vacation)
+        .options(joinedload(Vacation.user).joinedload(User.balance))
+        .filter(Vacation.status == 'pending')
+        .order_by(Vacation.id)
+        .all()
+    )
+
+    # (used, remaining) per requester
+    balances = {}
+    for vacation in pending:
+        requester = vacation.user
+        if requester is not None and requester.id not in balances:
+            balance = requester.balance or get_balance(requester)
+            balances[requester.id] = (balance.used_days, balance.remaining_days)
+
+    return pending, balances
+
+# Function to load one page of processed vacations, newest first, using keyset pagination.
+# `after` is the cursor returned for the previous page; returns (vacations, cursor of the next page or None).
+def load_processed_vacations(page_size=20, after=None, user_id=None, role=None, status=None, start_date=None, end_date=None):
+    query = session.query(Vacation).join(Vacation.user).options(contains_eager(Vacation.user))
+
+    if status:
+        query = query.filter(Vacation.status == status)
+    else:
+        query = query.filter(Vacation.status.in_(PROCESSED_STATUSES))
+    if user_id is not None:
+        query = query.filter(Vacation.user_id == user_id)
+    if role:
+        query = query.filter(User.role == role)
+    if start_date is not None:
+        query = query.filter(Vacation.end_date >= start_date)
+    if end_date is not None:
+        query = query.filter(Vacation.start_date <= end_date)
+    if after is not None:
+        after_date, after_id = after
+        query = query.filter(or_(
+            Vacation.start_date < after_date,
+            and_(Vacation.start_date == after_date, Vacation.id < after_id),
+        ))
 
-session = SessionLocal()
+    vacations = query.order_by(Vacation.start_date.desc(), Vacation.id.desc()).limit(page_size + 1).all()
+    if len(vacations) > page_size:
+        last = vacations[page_size - 1]
+        return vacations[:page_size], (last.start_date, last.id)
+    return vacations, None
@@ -0,0 +1,24 @@
+import sys
+import os
+import argparse
+from datetime import date
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import init_db
+from app.vacation_export import export_vacations
+
+# Urlaubshistorie für die Lohnbuchhaltung exportieren (CSV oder Parquet)
+parser = argparse.ArgumentParser(description="Export the vacation history to CSV or Parquet.")
+parser.add_argument("output", help="output file (.csv or .parquet)")
+parser.add_argument("--from", dest="start_date", type=date.fromisoformat, help="only vacations ending on or after this date (YYYY-MM-DD)")
+parser.add_argument("--to", dest="end_date", type=date.fromisoformat, help="only vacations starting on or before this date (YYYY-MM-DD)")
+parser.add_argument("--role", help="only users with this role")
+args = parser.parse_args()
+
+file_format = "parquet" if args.output.lower().endswith(".parquet") else "csv"
+
+init_db()
+with open(args.output, "wb") as out:
+    export_vacations(out, file_format, args.start_date, args.end_date, args.role)
+
+print(f"Vacation history exported to {args.output}.")
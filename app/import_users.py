@@ -0,0 +1,24 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import init_db
+from app.user_auth import import_users
+
+# Benutzer aus einer CSV- oder Excel-Datei importieren
+# Spalten: username, email, password, vacation_days, role, monthly_vacation_days
+if len(sys.argv) != 2:
+    print("Usage: python app/import_users.py <users.csv|users.xlsx>")
+    sys.exit(1)
+
+init_db()
+imported, report = import_users(sys.argv[1])
+
+for row_number, username, error in report:
+    print(f"Row {row_number} ({username}): {error}")
+
+if report:
+    print(f"No user imported: {len(report)} row(s) with errors. Fix the file and run the import again.")
+    sys.exit(1)
+
+print(f"{imported} user(s) imported.")
@@ -0,0 +1,95 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Queries slower than this end up in the slow query log
+SLOW_QUERY_MS = float(os.environ.get("VACATION_MANAGER_SLOW_QUERY_MS", 50))
+
+# One JSON line per rerun for offline analysis
+RERUN_LOG_PATH = os.environ.get("VACATION_MANAGER_RERUN_LOG", "rerun_metrics.jsonl")
+
+recent_reruns = deque(maxlen=100)
+slow_queries = deque(maxlen=200)
+_lock = threading.Lock()
+
+# Stats of the rerun running on this thread (Streamlit runs each script run on its own thread)
+_current = threading.local()
+
+_logger = logging.getLogger("vacation_manager.reruns")
+_logger.propagate = False
+_logger.setLevel(logging.INFO)
+
+def _log_line(summary):
+    if not _logger.handlers:
+        with _lock:
+            if not _logger.handlers:
+                _logger.addHandler(logging.FileHandler(RERUN_LOG_PATH, encoding="utf-8"))
+    _logger.info(json.dumps(summary, default=str))
+
+# Start collecting stats for a new rerun (finishes a previous one interrupted by st.experimental_rerun).
+# Button callbacks run before the script and start the rerun with callback=True; the script then keeps that run.
+def start_rerun(callback=False):
+    stats = getattr(_current, "stats", None)
+    if stats is not None and stats["callback"]:
+        stats["callback"] = callback
+        return
+    if stats is not None:
+        finish_rerun(interrupted=True)
+    _current.stats = {
+        "started": time.time(), "clock": time.perf_counter(), "queries": 0, "db_ms": 0.0, "phases": {}, "info": {},
+        "callback": callback,
+    }
+
+# Attach extra fields (page, user, ...) to the current rerun
+def annotate_rerun(**fields):
+    stats = getattr(_current, "stats", None)
+    if stats is not None:
+        stats["info"].update(fields)
+
+# Called by the engine event hooks for every executed statement
+def record_query(statement, duration_ms):
+    stats = getattr(_current, "stats", None)
+    if stats is not None:
+        stats["queries"] += 1
+        stats["db_ms"] += duration_ms
+    if duration_ms >= SLOW_QUERY_MS:
+        with _lock:
+            slow_queries.append({"at": time.time(), "duration_ms": round(duration_ms, 3), "statement": statement})
+
+# Add the time since `started` (time.perf_counter()) to a named phase of the current rerun
+def record_phase(name, started):
+    stats = getattr(_current, "stats", None)
+    if stats is not None:
+        stats["phases"][name] = stats["phases"].get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+@contextmanager
+def phase(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, started)
+
+# Close the current rerun: keep its summary for the diagnostics page and write the log line
+def finish_rerun(interrupted=False):
+    stats = getattr(_current, "stats", None)
+    if stats is None:
+        return None
+    _current.stats = None
+    summary = {
+        "started": stats["started"],
+        "total_ms": round((time.perf_counter() - stats["clock"]) * 1000, 3),
+        "queries": stats["queries"],
+        "db_ms": round(stats["db_ms"], 3),
+        "phases": {name: round(ms, 3) for name, ms in stats["phases"].items()},
+        "interrupted": interrupted,
+        **stats["info"],
+    }
+    with _lock:
+        recent_reruns.append(summary)
+    _log_line(summary)
+    return summary
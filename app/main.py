@@ -1,26 +1,60 @@
 import sys
 import os
-from datetime import time, timedelta, datetime, date
+import functools
+import tempfile
+from datetime import time, datetime
+from time import perf_counter
+from http.cookies import SimpleCookie
 import streamlit as st
+import streamlit.components.v1 as components
+from streamlit.web.server.websocket_headers import _get_websocket_headers
+from sqlalchemy.orm import joinedload
 
 # Stelle sicher, dass der 'app'-Ordner im Python-Suchpfad enthalten ist
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app.database import init_db, session, User, Vacation, Settings
-from app.user_auth import login_user, register_user
+from app.database import (
+    init_db, session, User, Vacation, Settings, load_vacation_requests, load_processed_vacations,
+    get_balance, set_vacation_days, change_user_role, delete_user, retry_on_locked, get_settings,
+    invalidate_settings, get_user, invalidate_user, ROLES, cache_stats, initialize_settings,
+    WeekendDay, Holiday, RoleShift, get_calendar, invalidate_calendar, reconcile_balances, set_actor,
+)
+from app.vacation_days import calculate_vacation_days
+from app.work_calendar import Shift
+from app.vacation_export import export_vacations
+from app.services import (
+    calculate_remaining_vacation_days, submit_vacation, approve_vacations, deny_vacations, update_vacation,
+    shift_vacations, delete_vacation,
+)
+from app.auto_approval import auto_approve
+from app.accrual import accrue_vacation_days, last_accrual_period
+from app.overlap_index import warm_overlap_index, find_overlapping_vacations
+from app.balance_history import balance_as_of, load_events
+from app.instrumentation import (
+    start_rerun, finish_rerun, annotate_rerun, phase, record_phase, recent_reruns, slow_queries,
+)
+from app.user_auth import (
+    login_user, register_user, import_users, login_locked, create_session_token, verify_session_token, revoke_session_tokens,
+    SESSION_TOKEN_LIFETIME,
+)
 
 # Set page configuration (must be the first Streamlit command)
 st.set_page_config(page_title="Gestionnaire de vacances", layout="wide")
 
+# Start every script run with a fresh database session (reruns reuse the same thread)
+session.remove()
+set_actor(None)
+start_rerun()
+
 # Initialize session state variables if they don't exist
 if 'vacation_start_date' not in st.session_state:
     st.session_state.vacation_start_date = None
 if 'vacation_end_date' not in st.session_state:
     st.session_state.vacation_end_date = None
 if 'vacation_start_time' not in st.session_state:
-    st.session_state.vacation_start_time = time(7, 30)
+    st.session_state.vacation_start_time = None  # start of the user's shift
 if 'vacation_end_time' not in st.session_state:
-    st.session_state.vacation_end_time = time(16, 0)
+    st.session_state.vacation_end_time = None  # end of the user's shift
 
 # Custom CSS for background, sidebar, text colors, and selectbox
 st.markdown(
@@ -64,89 +98,210 @@ def format_date(d):
 def format_time(t):
     return t.strftime('%H:%M') if t else "Full Day"
 
-# Function to delete a specific vacation
-def delete_vacation(vacation_id):
-    session.query(Vacation).filter(Vacation.id == vacation_id).delete()
+# Function to save the vacation days, monthly days and role of a user
+@retry_on_locked
+def save_user(user_id, remaining_days, monthly_vacation_days, role):
+    user = session.get(User, user_id)
+    set_vacation_days(user, remaining_days + get_balance(user).used_days)  # Set total vacation days including already taken days
+    user.monthly_vacation_days = monthly_vacation_days
+    change_user_role(user, role)
     session.commit()
+    invalidate_user(user.id, user.username)
 
-# Function to check vacation limits
-def check_vacation_limits(user_role, start_date, end_date):
-    settings = session.query(Settings).first()
-    if user_role == 'Tourneur':
-        limit = settings.dreher_limit
-    elif user_role == 'Fraiseur':
-        limit = settings.fraeser_limit
-    elif user_role == 'Soudeur':
-        limit = settings.schweisser_limit
-    else:
-        return True  # No limit for other roles
-
-    overlapping_vacations = session.query(Vacation).join(User).filter(
-        User.role == user_role,
-        Vacation.status == 'approved',
-        Vacation.start_date <= end_date,
-        Vacation.end_date >= start_date
-    ).count()
-
-    return overlapping_vacations < limit
-
-# Function to calculate used vacation days
-def calculate_used_vacation_days(user_id):
-    approved_vacations = session.query(Vacation).filter_by(user_id=user_id, status='approved').all()
-    used_days = sum(calculate_vacation_days(vacation.start_date, vacation.end_date, vacation.start_time, vacation.end_time) for vacation in approved_vacations)
-    return used_days
-
-# Function to calculate remaining vacation days
-def calculate_remaining_vacation_days(user_id):
-    user = session.query(User).filter_by(id=user_id).first()
-    used_days = calculate_used_vacation_days(user_id)
-    return user.vacation_days - used_days
-
-# Function to calculate the exact number of vacation days based on times
-def calculate_vacation_days(start_date, end_date, start_time, end_time):
-    full_days = (end_date - start_date).days
-    total_days = 0.0
-
-    if full_days > 0:
-        first_day_hours = (datetime.combine(date.today(), time(16, 0)) - datetime.combine(date.today(), start_time)).seconds / 3600.0
-        if start_time <= time(12, 0) and end_time > time(12, 30):
-            first_day_hours -= 0.5  # Deduct lunch break if it falls within the vacation period
-        total_days += first_day_hours / 8.0
-
-        total_days += full_days - 1
-
-        last_day_hours = (datetime.combine(date.today(), end_time) - datetime.combine(date.today(), time(7, 30))).seconds / 3600.0
-        if start_time <= time(12, 0) and end_time > time(12, 30):
-            last_day_hours -= 0.5  # Deduct lunch break if it falls within the vacation period
-        total_days += last_day_hours / 8.0
-    else:
-        work_hours = (datetime.combine(date.today(), end_time) - datetime.combine(date.today(), start_time)).seconds / 3600.0
-        if start_time <= time(12, 0) and end_time > time(12, 30):
-            work_hours -= 0.5  # Deduct lunch break if it falls within the vacation period
-        total_days += work_hours / 8.0
-
-    return round(total_days, 4)
+# Function to delete a user account
+@retry_on_locked
+def delete_user_account(user_id):
+    username = session.query(User.username).filter_by(id=user_id).scalar()
+    delete_user(user_id)
+    session.commit()
+    invalidate_user(user_id, username)
 
-# Valid times for selection
-valid_times = [time(7, 30), time(8, 0), time(8, 30), time(9, 0), time(9, 30), time(10, 0), 
-               time(10, 30), time(11, 0), time(11, 30), time(12, 0), time(12, 30), time(13, 0), 
-               time(13, 30), time(14, 0), time(14, 30), time(15, 0), time(15, 30), time(16, 0)]
+# Function to save the role limits
+@retry_on_locked
+def save_limits(dreher_limit, fraeser_limit, schweisser_limit):
+    settings = session.query(Settings).first()
+    settings.dreher_limit = dreher_limit
+    settings.fraeser_limit = fraeser_limit
+    settings.schweisser_limit = schweisser_limit
+    session.commit()
+    invalidate_settings()
+
+# Function to save the weekend days and the shifts per role, then rebuild the balances with the new calendar
+@retry_on_locked
+def save_calendar(weekend, shifts):
+    session.query(WeekendDay).delete()
+    session.add_all(WeekendDay(weekday=weekday) for weekday in weekend)
+    for role, shift in shifts.items():
+        session.merge(RoleShift(role=role, start_time=shift.start, end_time=shift.end, lunch_start=shift.lunch_start, lunch_end=shift.lunch_end))
+    session.commit()
+    invalidate_calendar()
+    return reconcile_balances()
 
-# Initialize the database
-init_db()
+# Function to add (or rename) a holiday, then rebuild the balances
+@retry_on_locked
+def save_holiday(day, name):
+    session.merge(Holiday(day=day, name=name))
+    session.commit()
+    invalidate_calendar()
+    return reconcile_balances()
 
-# Ensure that settings are initialized
-def initialize_settings():
-    settings = session.query(Settings).first()
-    if not settings:
-        settings = Settings(dreher_limit=2, fraeser_limit=2, schweisser_limit=2)
-        session.add(settings)
-        session.commit()
+# Function to delete a holiday, then rebuild the balances
+@retry_on_locked
+def delete_holiday(day):
+    session.query(Holiday).filter_by(day=day).delete()
+    session.commit()
+    invalidate_calendar()
+    return reconcile_balances()
+
+# Button callbacks run before the script, so they set the acting user for the event log themselves
+# and start the rerun stats, which then include their writes
+def acting(callback):
+    @functools.wraps(callback)
+    def wrapper(*args, **kwargs):
+        start_rerun(callback=True)
+        annotate_rerun(callback=callback.__name__)
+        current_user = st.session_state.get('user')
+        set_actor(current_user.id if current_user is not None else None)
+        return callback(*args, **kwargs)
+    return wrapper
+
+# Message shown once at the top of the admin page on the next run (set by button callbacks)
+def flash(kind, text):
+    st.session_state.admin_message = (kind, text)
+
+def show_admin_message():
+    if 'admin_message' in st.session_state:
+        kind, text = st.session_state.pop('admin_message')
+        getattr(st, kind)(text)
+
+# The session token is kept in a cookie, never in the URL (browser history, shared links, proxy logs)
+SESSION_COOKIE = "vacation_manager_session"
+
+# Function to read the session cookie the browser sent when it opened the page
+def read_session_cookie():
+    try:
+        headers = _get_websocket_headers() or {}
+    except RuntimeError:
+        return None  # not connected to a browser (e.g. AppTest)
+    cookies = SimpleCookie(headers.get("Cookie", ""))
+    return cookies[SESSION_COOKIE].value if SESSION_COOKIE in cookies else None
+
+# Function to set the session cookie (None deletes it); the browser gets it on the next run
+def set_session_cookie(token):
+    st.session_state.session_cookie = token or ""
+
+# Streamlit cannot set response headers, so the cookie is written by a small script in the page
+def write_session_cookie():
+    if 'session_cookie' in st.session_state:
+        token = st.session_state.pop('session_cookie')
+        max_age = SESSION_TOKEN_LIFETIME if token else 0
+        components.html(
+            f"<script>window.parent.document.cookie = '{SESSION_COOKIE}={token}; path=/; max-age={max_age}; SameSite=Strict';</script>",
+            height=0,
+        )
 
-initialize_settings()
+# Button callbacks: they run before the page is built, so no extra st.experimental_rerun() is needed
+@acting
+def approve_action(vacation_ids):
+    _, blocked = approve_vacations(vacation_ids)
+    if blocked:
+        flash("warning", "Impossible d'approuver : " + "; ".join(
+            f"{vacation.user.username} (limite atteinte pour le rôle {vacation.user.role} le {format_date(day)})" for vacation, day in blocked
+        ))
+    elif len(vacation_ids) > 1:
+        flash("success", f"{len(vacation_ids)} demandes approuvées.")
+
+@acting
+def add_holiday_action():
+    drift = save_holiday(st.session_state.holiday_day, st.session_state.holiday_name)
+    flash("success", f"Jour férié ajouté, {len(drift)} soldes recalculés.")
+
+@acting
+def delete_holiday_action():
+    drift = delete_holiday(st.session_state.removed_holiday)
+    flash("success", f"Jour férié supprimé, {len(drift)} soldes recalculés.")
+
+@acting
+def accrual_action():
+    months = accrue_vacation_days()
+    if months:
+        flash("success", "Jours mensuels crédités pour : " + ", ".join(f"{month:%m-%Y}" for month in months))
+    else:
+        flash("info", "Tous les mois sont déjà crédités.")
+
+@acting
+def auto_approve_action():
+    accepted, blocked = auto_approve(st.session_state.auto_priority)
+    flash("success", f"{len(accepted)} demandes approuvées automatiquement, {len(blocked)} restent en attente.")
+
+@acting
+def deny_action(vacation_ids):
+    deny_vacations(vacation_ids)
+
+@acting
+def bulk_action(action):
+    vacation_ids = st.session_state.get("bulk_selection", [])
+    if not vacation_ids:
+        flash("info", "Aucune demande sélectionnée.")
+    elif action == "approve":
+        approve_action(vacation_ids)
+    elif action == "deny":
+        deny_vacations(vacation_ids)
+        flash("success", f"{len(vacation_ids)} demandes refusées.")
+    elif action == "shift":
+        shift_vacations(vacation_ids, int(st.session_state.bulk_shift_days))
+        # Forget the edited dates of these rows so they show the shifted dates
+        for vacation_id in vacation_ids:
+            st.session_state.pop(f"start_{vacation_id}", None)
+            st.session_state.pop(f"end_{vacation_id}", None)
+        flash("success", f"{len(vacation_ids)} demandes décalées.")
+    st.session_state.bulk_selection = []
+
+@acting
+def save_vacation_form(vacation_id):
+    update_vacation(
+        vacation_id,
+        start_date=st.session_state[f"start_{vacation_id}"],
+        end_date=st.session_state[f"end_{vacation_id}"],
+        start_time=st.session_state[f"start_time_{vacation_id}"],
+        end_time=st.session_state[f"end_time_{vacation_id}"],
+    )
+
+# Number of processed requests shown per page
+PROCESSED_PAGE_SIZE = 20
+
+# Priorities offered for the automatic approval
+AUTO_PRIORITY_LABELS = {"submission": "Ordre de soumission", "start_date": "Date de début", "shortest": "Plus courtes d'abord"}
+
+# Names of the event kinds in the balance journal
+EVENT_LABELS = {
+    "create": "Demande", "approve": "Approbation", "deny": "Refus", "edit": "Modification",
+    "delete": "Suppression", "accrual": "Crédit mensuel", "adjust": "Ajustement",
+}
+
+# Names of the weekdays (date.weekday() order)
+WEEKDAY_NAMES = ("Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi", "Samedi", "Dimanche")
+
+# Function to list the selectable times of a role's shift, plus the given times if they are off that grid
+# (so a stored vacation can always be shown and edited)
+def time_choices(role, *times):
+    return sorted(set(get_calendar().shift(role).times()) | {t for t in times if t is not None})
+
+# Work that only has to happen once per server process, not on every rerun:
+# schema migrations, default settings and reading the logo from assets/
+LOGO_PATH = os.path.join(os.path.dirname(__file__), '..', 'assets', 'logo new.png')
+
+@st.cache_resource(show_spinner=False)
+def bootstrap():
+    init_db()
+    initialize_settings()
+    with open(LOGO_PATH, 'rb') as logo_file:
+        return logo_file.read()
+
+logo = bootstrap()
 
 # Insert company logo
-st.image("https://raw.githubusercontent.com/TomGroeber/Urlaub-nehmen/main/assets/logo new.png", width=500)
+st.image(logo, width=500)
 
 
 st.title("Gestionnaire de vacances")
@@ -155,117 +310,219 @@ st.title("Gestionnaire de vacances")
 if 'user' not in st.session_state:
     st.session_state.user = None
 
+# A page refresh starts a new session: log back in from the signed token in the session cookie
+# without checking the password again (checked once per session; logout revokes the token)
+if st.session_state.user is None and not st.session_state.get("session_cookie_checked"):
+    st.session_state.session_cookie_checked = True
+    token = read_session_cookie()
+    if token:
+        with phase("login"):
+            token_user_id = verify_session_token(token)
+            st.session_state.user = get_user(token_user_id) if token_user_id is not None else None
+        if st.session_state.user is None:
+            set_session_cookie(None)
+
+write_session_cookie()
+
 if st.session_state.user is None:
     st.subheader("Connectez-vous à votre compte")
     username = st.text_input("Nom d'utilisateur")
     password = st.text_input("Mot de passe", type="password")
     if st.button("Se connecter"):
-        user = login_user(username, password)
+        with phase("login"):
+            user = login_user(username, password)
         if user:
             st.session_state.user = user
+            set_session_cookie(create_session_token(user))
             st.experimental_rerun()
+        elif login_locked(username):
+            st.error("Trop de tentatives échouées. Réessayez dans quelques minutes.")
         else:
             st.error("Identifiants invalides")
 
 else:
-    user = st.session_state.user
+    # Reload the logged-in user (cached; admin changes invalidate it, so role changes are picked up)
+    user = get_user(st.session_state.user.id)
+    if user is None:
+        del st.session_state.user
+        set_session_cookie(None)
+        st.experimental_rerun()
+    st.session_state.user = user
+    set_actor(user.id)
+    annotate_rerun(user=user.username, role=user.role)
     if user.role == 'Admin':
         st.write(f"Bienvenue, {user.username}!")
         st.write(f"Rôle: {user.role}")
         st.write("Vous avez ∞ jours de vacances restants.")
     else:
-        remaining_days = calculate_remaining_vacation_days(user.id)
+        with phase("balance"):
+            remaining_days = calculate_remaining_vacation_days(user.id)
         st.write(f"Bienvenue, {user.username}!")
         st.write(f"Rôle: {user.role}")
         st.write(f"Il vous reste {remaining_days:.4f} jours de vacances.")
 
     # Logout Button
     if st.button("Se déconnecter"):
+        revoke_session_tokens(user.id)
         del st.session_state.user
+        set_session_cookie(None)
         st.experimental_rerun()
 
     # Admin view
     if user.role == 'Admin':
-        admin_choice = st.sidebar.selectbox("Actions administratives", ["Gérer les demandes de vacances", "Gérer les utilisateurs", "Définir les limites", "Créer un utilisateur"])
+        admin_choice = st.sidebar.selectbox("Actions administratives", ["Gérer les demandes de vacances", "Gérer les utilisateurs", "Définir les limites", "Calendrier", "Créer un utilisateur", "Exporter l'historique", "Journal des soldes", "Diagnostics"])
+        annotate_rerun(page=admin_choice)
         
         if admin_choice == "Gérer les demandes de vacances":
             st.subheader("Vue administrateur : Demandes de vacances")
+            show_admin_message()
 
-            pending_vacations = session.query(Vacation).filter_by(status='pending').all()
-            processed_vacations = session.query(Vacation).filter(Vacation.status != 'pending').all()
+            with phase("balance"):
+                pending_vacations, balances = load_vacation_requests()
 
             # Display pending requests
+            # Every row is its own form: editing its widgets does not rerun the page, and its buttons
+            # apply the change in a callback before the single rerun that follows.
+            render_started = perf_counter()
             if pending_vacations:
                 st.markdown("### Demandes en attente")
+
+                # Bulk actions, each applied in one transaction
+                labels = {vacation.id: f"{vacation.user.username} ({vacation.user.role}) : {format_date(vacation.start_date)} - {format_date(vacation.end_date)}" for vacation in pending_vacations}
+                with st.form("bulk_form"):
+                    st.multiselect("Demandes sélectionnées", list(labels), format_func=labels.get, key="bulk_selection")
+                    bulk_col1, bulk_col2, bulk_col3, bulk_col4 = st.columns([1, 1, 1, 1])
+                    with bulk_col1:
+                        st.form_submit_button("Approuver la sélection", on_click=bulk_action, args=("approve",))
+                    with bulk_col2:
+                        st.form_submit_button("Refuser la sélection", on_click=bulk_action, args=("deny",))
+                    with bulk_col3:
+                        st.number_input("Décaler de (jours)", value=0, step=1, key="bulk_shift_days")
+                    with bulk_col4:
+                        st.form_submit_button("Décaler les dates", on_click=bulk_action, args=("shift",))
+
+                # Automatic approval of the whole queue, with a preview of what would happen
+                with st.expander("Approbation automatique"):
+                    st.selectbox("Priorité", list(AUTO_PRIORITY_LABELS), format_func=AUTO_PRIORITY_LABELS.get, key="auto_priority")
+                    auto_col1, auto_col2 = st.columns([1, 1])
+                    with auto_col1:
+                        show_preview = st.button("Aperçu", key="auto_preview")
+                    with auto_col2:
+                        st.button("Approuver automatiquement", key="auto_run", on_click=auto_approve_action)
+                    if show_preview:
+                        accepted, blocked = auto_approve(st.session_state.auto_priority, dry_run=True)
+                        st.dataframe(
+                            [{
+                                "Utilisateur": vacation.user.username,
+                                "Rôle": vacation.user.role,
+                                "Du": format_date(vacation.start_date),
+                                "Au": format_date(vacation.end_date),
+                                "Résultat": "Approuvée",
+                            } for vacation in accepted] + [{
+                                "Utilisateur": vacation.user.username,
+                                "Rôle": vacation.user.role,
+                                "Du": format_date(vacation.start_date),
+                                "Au": format_date(vacation.end_date),
+                                "Résultat": "Solde insuffisant" if day is None else f"Limite atteinte le {format_date(day)}",
+                            } for vacation, day in blocked],
+                            use_container_width=True,
+                        )
+
                 for vacation in pending_vacations:
-                    requester = session.query(User).filter_by(id=vacation.user_id).first()
-                    remaining_days_user = calculate_remaining_vacation_days(requester.id)  # Calculate remaining days for the user
+                    requester = vacation.user
+                    remaining_days_user = balances[requester.id][1]  # Remaining days for the user
                     st.markdown(f"<div style='font-weight: bold;'>{requester.username} ({requester.role}) - Jours restants: {remaining_days_user:.4f} <br>Du {format_date(vacation.start_date)} au {format_date(vacation.end_date)} <br><span style='color: orange;'>{vacation.status}</span></div>", unsafe_allow_html=True)
                     st.write(f"**Note:** {vacation.note}")
                     st.write(f"**Heure:** {format_time(vacation.start_time)} - {format_time(vacation.end_time)}")
-                    col1, col2, col3 = st.columns([2, 1, 1])
-                    with col1:
-                        if st.button(f"Approuver {vacation.id}", key=f"approve_{vacation.id}"):
-                            if not check_vacation_limits(requester.role, vacation.start_date, vacation.end_date):
-                                st.warning(f"Impossible d'approuver les vacances pour {requester.username}. Limite atteinte pour le rôle {requester.role}.")
-                            else:
-                                vacation.status = 'approved'
-                                session.commit()
-                                st.experimental_rerun()
-                        if st.button(f"Refuser {vacation.id}", key=f"deny_{vacation.id}"):
-                            vacation.status = 'denied'
-                            session.commit()
-                            st.experimental_rerun()
-                    with col2:
-                        new_start_date = st.date_input("Date de début", vacation.start_date, key=f"start_{vacation.id}")
-                        new_end_date = st.date_input("Date de fin", vacation.end_date, key=f"end_{vacation.id}")
-                        start_time = vacation.start_time if vacation.start_time else valid_times[0]
-                        end_time = vacation.end_time if vacation.end_time else valid_times[-1]
-                        new_start_time = st.selectbox("Heure de début", valid_times, index=valid_times.index(start_time), key=f"start_time_{vacation.id}")
-                        new_end_time = st.selectbox("Heure de fin", valid_times, index=valid_times.index(end_time), key=f"end_time_{vacation.id}")
-                        if st.button(f"Mettre à jour {vacation.id}", key=f"update_{vacation.id}"):
-                            vacation.start_date = new_start_date
-                            vacation.end_date = new_end_date
-                            vacation.start_time = new_start_time
-                            vacation.end_time = new_end_time
-                            session.commit()
-                            st.experimental_rerun()
-                    with col3:
-                        if st.button(f"Supprimer {vacation.id}", key=f"delete_{vacation.id}"):
-                            delete_vacation(vacation.id)
-                            session.commit()
-                            st.experimental_rerun()
-                    st.markdown("<hr>", unsafe_allow_html=True)  # Separation between requests
-
-            # Display processed requests
-            if processed_vacations:
-                with st.expander("Demandes traitées", expanded=False):
-                    for vacation in processed_vacations:
-                        requester = session.query(User).filter_by(id=vacation.user_id).first()
-                        st.markdown(f"<div style='font-weight: bold;'>{requester.username} ({requester.role}): <br>Du {format_date(vacation.start_date)} au {format_date(vacation.end_date)} <br><span style='color: green;'>{vacation.status}</span></div>", unsafe_allow_html=True)
-                        st.write(f"**Note:** {vacation.note}")
-                        st.write(f"**Heure:** {format_time(vacation.start_time)} - {format_time(vacation.end_time)}")
+                    with st.form(f"pending_{vacation.id}"):
+                        col1, col2, col3 = st.columns([2, 1, 1])
+                        with col1:
+                            st.form_submit_button(f"Approuver {vacation.id}", on_click=approve_action, args=([vacation.id],))
+                            st.form_submit_button(f"Refuser {vacation.id}", on_click=deny_action, args=([vacation.id],))
+                        with col2:
+                            st.date_input("Date de début", vacation.start_date, key=f"start_{vacation.id}")
+                            st.date_input("Date de fin", vacation.end_date, key=f"end_{vacation.id}")
+                            shift = get_calendar().shift(requester.role)
+                            start_time = vacation.start_time or shift.start
+                            end_time = vacation.end_time or shift.end
+                            row_times = time_choices(requester.role, start_time, end_time)
+                            st.selectbox("Heure de début", row_times, index=row_times.index(start_time), key=f"start_time_{vacation.id}")
+                            st.selectbox("Heure de fin", row_times, index=row_times.index(end_time), key=f"end_time_{vacation.id}")
+                            st.form_submit_button(f"Mettre à jour {vacation.id}", on_click=save_vacation_form, args=(vacation.id,))
+                        with col3:
+                            st.form_submit_button(f"Supprimer {vacation.id}", on_click=acting(delete_vacation), args=(vacation.id,))
+
+            record_phase("render_pending", render_started)
+
+            # Display processed requests, one page at a time (nothing is loaded while hidden)
+            if st.toggle("Demandes traitées", key="show_processed"):
+                user_options = [(row.id, row.username) for row in session.query(User.id, User.username).order_by(User.username)]
+                filter_col1, filter_col2, filter_col3, filter_col4 = st.columns(4)
+                with filter_col1:
+                    filter_user = st.selectbox("Utilisateur", [None] + user_options, format_func=lambda option: "Tous" if option is None else option[1], key="processed_user")
+                with filter_col2:
+                    filter_role = st.selectbox("Rôle", [None, *ROLES], format_func=lambda option: option or "Tous", key="processed_role")
+                with filter_col3:
+                    filter_status = st.selectbox("Statut", [None, "approved", "denied"], format_func=lambda option: option or "Tous", key="processed_status")
+                with filter_col4:
+                    filter_period = st.date_input("Période", value=(), key="processed_period")
+                filter_start = filter_period[0] if len(filter_period) > 0 else None
+                filter_end = filter_period[1] if len(filter_period) > 1 else None
+
+                # Go back to the first page whenever a filter changes
+                filters = (filter_user, filter_role, filter_status, filter_start, filter_end)
+                if st.session_state.get('processed_filters') != filters:
+                    st.session_state.processed_filters = filters
+                    st.session_state.processed_cursors = [None]
+                cursors = st.session_state.processed_cursors
+
+                render_started = perf_counter()
+                processed_vacations, next_cursor = load_processed_vacations(
+                    PROCESSED_PAGE_SIZE,
+                    after=cursors[-1],
+                    user_id=filter_user[0] if filter_user else None,
+                    role=filter_role,
+                    status=filter_status,
+                    start_date=filter_start,
+                    end_date=filter_end,
+                )
+                if not processed_vacations:
+                    st.write("Aucune demande traitée trouvée.")
+
+                for vacation in processed_vacations:
+                    requester = vacation.user
+                    st.markdown(f"<div style='font-weight: bold;'>{requester.username} ({requester.role}): <br>Du {format_date(vacation.start_date)} au {format_date(vacation.end_date)} <br><span style='color: green;'>{vacation.status}</span></div>", unsafe_allow_html=True)
+                    st.write(f"**Note:** {vacation.note}")
+                    st.write(f"**Heure:** {format_time(vacation.start_time)} - {format_time(vacation.end_time)}")
+                    with st.form(f"processed_{vacation.id}"):
                         col1, col2 = st.columns([2, 1])
                         with col1:
-                            new_start_date = st.date_input("Date de début", vacation.start_date, key=f"start_{vacation.id}")
-                            new_end_date = st.date_input("Date de fin", vacation.end_date, key=f"end_{vacation.id}")
-                            start_time = vacation.start_time if vacation.start_time else valid_times[0]
-                            end_time = vacation.end_time if vacation.end_time else valid_times[-1]
-                            new_start_time = st.selectbox("Heure de début", valid_times, index=valid_times.index(start_time), key=f"start_time_{vacation.id}")
-                            new_end_time = st.selectbox("Heure de fin", valid_times, index=valid_times.index(end_time), key=f"end_time_{vacation.id}")
-                            if st.button(f"Mettre à jour {vacation.id}", key=f"update_{vacation.id}"):
-                                vacation.start_date = new_start_date
-                                vacation.end_date = new_end_date
-                                vacation.start_time = new_start_time
-                                vacation.end_time = new_end_time
-                                session.commit()
-                                st.experimental_rerun()
+                            st.date_input("Date de début", vacation.start_date, key=f"start_{vacation.id}")
+                            st.date_input("Date de fin", vacation.end_date, key=f"end_{vacation.id}")
+                            shift = get_calendar().shift(requester.role)
+                            start_time = vacation.start_time or shift.start
+                            end_time = vacation.end_time or shift.end
+                            row_times = time_choices(requester.role, start_time, end_time)
+                            st.selectbox("Heure de début", row_times, index=row_times.index(start_time), key=f"start_time_{vacation.id}")
+                            st.selectbox("Heure de fin", row_times, index=row_times.index(end_time), key=f"end_time_{vacation.id}")
+                            st.form_submit_button(f"Mettre à jour {vacation.id}", on_click=save_vacation_form, args=(vacation.id,))
                         with col2:
-                            if st.button(f"Supprimer {vacation.id}", key=f"delete_{vacation.id}"):
-                                delete_vacation(vacation.id)
-                                session.commit()
-                                st.experimental_rerun()
-                        st.markdown("<hr>", unsafe_allow_html=True)  # Separation between requests
+                            st.form_submit_button(f"Supprimer {vacation.id}", on_click=acting(delete_vacation), args=(vacation.id,))
+
+                record_phase("render_processed", render_started)
+
+                # Page navigation
+                nav_col1, nav_col2, nav_col3 = st.columns([1, 1, 4])
+                with nav_col1:
+                    if len(cursors) > 1 and st.button("Page précédente", key="processed_previous"):
+                        cursors.pop()
+                        st.experimental_rerun()
+                with nav_col2:
+                    if next_cursor is not None and st.button("Page suivante", key="processed_next"):
+                        cursors.append(next_cursor)
+                        st.experimental_rerun()
+                with nav_col3:
+                    st.caption(f"Page {len(cursors)}")
 
             # Button to reset all vacations
             #st.markdown("---")
@@ -277,7 +534,18 @@ else:
         
         if admin_choice == "Gérer les utilisateurs":
             st.subheader("Vue administrateur : Gérer les utilisateurs")
-            users = session.query(User).all()
+            show_admin_message()
+
+            # Monthly accrual (normally run by app/accrue_vacation_days.py; the button catches up missed months)
+            last_period = last_accrual_period()
+            accrual_col1, accrual_col2 = st.columns([3, 1])
+            with accrual_col1:
+                st.caption(f"Dernier mois crédité : {last_period:%m-%Y}" if last_period else "Aucun mois crédité pour l'instant.")
+            with accrual_col2:
+                st.button("Créditer les jours mensuels", key="run_accrual", on_click=accrual_action)
+
+            render_started = perf_counter()
+            users = session.query(User).options(joinedload(User.balance)).all()
             
             for user in users:
                 if user.username != 'admin':
@@ -285,61 +553,216 @@ else:
                     with col1:
                         st.write(f"**{user.username} ({user.role})**")
                     with col2:
-                        remaining_days = calculate_remaining_vacation_days(user.id)
+                        balance = user.balance or get_balance(user)
+                        remaining_days = balance.remaining_days
                         new_vacation_days = st.number_input(f"Définir les jours de vacances pour {user.username}", min_value=0.0, value=float(remaining_days), step=0.1, format="%.4f", key=f"vac_days_{user.id}")
                         new_monthly_days = st.number_input(f"Jours de vacances mensuels pour {user.username}", min_value=0.0, value=float(user.monthly_vacation_days), step=0.0001, format="%.4f", key=f"monthly_days_{user.id}")
                     with col3:
-                        new_role = st.selectbox(f"Rôle pour {user.username}", ["Tourneur", "Fraiseur", "Soudeur", "Admin"], index=["Tourneur", "Fraiseur", "Soudeur", "Admin"].index(user.role), key=f"role_{user.id}")
+                        new_role = st.selectbox(f"Rôle pour {user.username}", ROLES, index=ROLES.index(user.role), key=f"role_{user.id}")
                     with col4:
                         if st.button(f"Mise à jour {user.username}", key=f"update_{user.id}"):
-                            user.vacation_days = new_vacation_days + calculate_used_vacation_days(user.id)  # Set total vacation days including already taken days
-                            user.monthly_vacation_days = new_monthly_days
-                            user.role = new_role
-                            session.commit()
+                            save_user(user.id, new_vacation_days, new_monthly_days, new_role)
                             st.experimental_rerun()
                     with col5:
                         if st.button(f"Supprimer {user.username}", key=f"delete_user_{user.id}"):
-                            session.query(User).filter_by(id=user.id).delete()
-                            session.commit()
+                            delete_user_account(user.id)
                             st.experimental_rerun()
                             st.success(f"Utilisateur {user.username} supprimé avec succès!")
                     st.markdown("<hr>", unsafe_allow_html=True)  # Separation between users
+            record_phase("render_users", render_started)
 
         if admin_choice == "Définir les limites":
             st.subheader("Vue administrateur : Définir les limites")
-            settings = session.query(Settings).first()
-            if not settings:
-                settings = Settings(dreher_limit=2, fraeser_limit=2, schweisser_limit=2)
-                session.add(settings)
-                session.commit()
+            settings = get_settings()
 
             new_tourneur_limit = st.number_input("Définir la limite pour Tourneur", min_value=1.0, value=float(settings.dreher_limit), step=0.1, format="%.1f")
             new_fraeser_limit = st.number_input("Définir la limite pour Fraiseur", min_value=1.0, value=float(settings.fraeser_limit), step=0.1, format="%.1f")
             new_schweisser_limit = st.number_input("Définir la limite pour Soudeur", min_value=1.0, value=float(settings.schweisser_limit), step=0.1, format="%.1f")
 
             if st.button("Mettre à jour les limites"):
-                settings.dreher_limit = new_tourneur_limit
-                settings.fraeser_limit = new_fraeser_limit
-                settings.schweisser_limit = new_schweisser_limit
-                session.commit()
+                save_limits(new_tourneur_limit, new_fraeser_limit, new_schweisser_limit)
                 st.success("Limites mises à jour avec succès")
 
+        if admin_choice == "Calendrier":
+            st.subheader("Vue administrateur : Calendrier de travail")
+            show_admin_message()
+            calendar = get_calendar()
+
+            # Weekend days and working hours per role
+            with st.form("calendar_form"):
+                new_weekend = st.multiselect("Jours non travaillés", list(range(7)), default=sorted(calendar.weekend), format_func=WEEKDAY_NAMES.__getitem__)
+                new_shifts = {}
+                for role in ROLES:
+                    if role == 'Admin':
+                        continue
+                    shift = calendar.shift(role)
+                    st.markdown(f"**Horaires {role}**")
+                    shift_col1, shift_col2, shift_col3, shift_col4 = st.columns(4)
+                    with shift_col1:
+                        shift_start = st.time_input("Début", shift.start, key=f"shift_start_{role}", step=900)
+                    with shift_col2:
+                        shift_end = st.time_input("Fin", shift.end, key=f"shift_end_{role}", step=900)
+                    with shift_col3:
+                        lunch_start = st.time_input("Début de la pause", shift.lunch_start, key=f"lunch_start_{role}", step=900)
+                    with shift_col4:
+                        lunch_end = st.time_input("Fin de la pause", shift.lunch_end, key=f"lunch_end_{role}", step=900)
+                    new_shifts[role] = Shift(shift_start, shift_end, lunch_start, lunch_end)
+                if st.form_submit_button("Mettre à jour le calendrier"):
+                    if any(not (shift.start <= shift.lunch_start <= shift.lunch_end <= shift.end) or shift.hours <= 0 for shift in new_shifts.values()):
+                        st.error("Les horaires doivent être dans l'ordre : début, pause, fin de la pause, fin.")
+                    else:
+                        drift = save_calendar(new_weekend, new_shifts)
+                        st.success(f"Calendrier mis à jour, {len(drift)} soldes recalculés.")
+
+            # Public holidays
+            st.markdown("### Jours fériés")
+            holidays = session.query(Holiday).order_by(Holiday.day).all()
+            if holidays:
+                st.dataframe([{"Date": format_date(holiday.day), "Nom": holiday.name} for holiday in holidays], use_container_width=True)
+            holiday_col1, holiday_col2 = st.columns(2)
+            with holiday_col1:
+                with st.form("holiday_form", clear_on_submit=True):
+                    st.date_input("Date", key="holiday_day")
+                    st.text_input("Nom", key="holiday_name")
+                    st.form_submit_button("Ajouter le jour férié", on_click=add_holiday_action)
+            with holiday_col2:
+                if holidays:
+                    with st.form("holiday_delete_form"):
+                        st.selectbox("Jour férié", [holiday.day for holiday in holidays], format_func=format_date, key="removed_holiday")
+                        st.form_submit_button("Supprimer le jour férié", on_click=delete_holiday_action)
+
         if admin_choice == "Créer un utilisateur":
             st.subheader("Vue administrateur : Créer un utilisateur")
             new_username = st.text_input("Nom d'utilisateur")
             new_email = st.text_input("Email")
             new_password = st.text_input("Mot de passe", type="password")
             new_vacation_days = st.number_input("Jours de vacances", min_value=0.0, step=0.1, format="%.4f")
-            new_role = st.selectbox("Rôle", ["Tourneur", "Fraiseur", "Soudeur", "Admin"])
+            new_role = st.selectbox("Rôle", ROLES)
             new_monthly_days = st.number_input("Jours de vacances mensuels", min_value=0.0, value=2.7342, step=0.0001, format="%.4f")
 
             if st.button("Créer un utilisateur"):
                 register_user(new_username, new_email, new_password, new_vacation_days, new_role, new_monthly_days)
                 st.success(f"Utilisateur {new_username} créé avec succès!")
+
+            # Bulk import from a file
+            st.markdown("<hr>", unsafe_allow_html=True)
+            st.subheader("Importer des utilisateurs")
+            st.caption("Fichier CSV ou Excel avec les colonnes : username, email, password, vacation_days, role, monthly_vacation_days")
+            users_file = st.file_uploader("Fichier des utilisateurs", type=["csv", "xlsx"])
+            if users_file is not None and st.button("Importer"):
+                imported, report = import_users(users_file, users_file.name)
+                if report:
+                    st.error(f"Aucun utilisateur importé : {len(report)} ligne(s) en erreur. Corrigez le fichier puis réessayez.")
+                    st.dataframe(
+                        [{"Ligne": row_number, "Nom d'utilisateur": username, "Erreur": error} for row_number, username, error in report],
+                        use_container_width=True,
+                    )
+                else:
+                    st.success(f"{imported} utilisateur(s) importé(s).")
+
+        if admin_choice == "Exporter l'historique":
+            st.subheader("Vue administrateur : Exporter l'historique")
+            export_period = st.date_input("Période", value=(), key="export_period")
+            export_role = st.selectbox("Rôle", [None, *ROLES], format_func=lambda option: option or "Tous", key="export_role")
+            export_format = st.radio("Format", ["csv", "parquet"], horizontal=True, key="export_format")
+
+            # The file is only built on request and written chunk by chunk to a temporary file
+            # (st.download_button still needs the finished file as bytes)
+            if st.button("Préparer l'export"):
+                with tempfile.TemporaryFile() as export_file:
+                    export_vacations(
+                        export_file,
+                        export_format,
+                        start_date=export_period[0] if len(export_period) > 0 else None,
+                        end_date=export_period[1] if len(export_period) > 1 else None,
+                        role=export_role,
+                    )
+                    export_file.seek(0)
+                    st.download_button(
+                        "Télécharger",
+                        data=export_file.read(),
+                        file_name=f"vacances.{export_format}",
+                        mime="text/csv" if export_format == "csv" else "application/octet-stream",
+                    )
+
+        if admin_choice == "Journal des soldes":
+            st.subheader("Vue administrateur : Journal des soldes")
+            usernames = dict(session.query(User.id, User.username).order_by(User.username).all())
+            journal_col1, journal_col2 = st.columns(2)
+            with journal_col1:
+                journal_user = st.selectbox("Utilisateur", [None, *usernames], format_func=lambda user_id: "Tous" if user_id is None else usernames[user_id], key="journal_user")
+            if journal_user is not None:
+                with journal_col2:
+                    as_of_day = st.date_input("Solde au", datetime.now().date(), key="journal_as_of")
+                vacation_days, used_days, remaining_days = balance_as_of(journal_user, datetime.combine(as_of_day, time.max))
+                st.write(f"**Jours acquis:** {vacation_days:.4f} — **Jours pris:** {used_days:.4f} — **Jours restants:** {remaining_days:.4f}")
+
+            events = load_events(journal_user)
+            if events:
+                st.dataframe(
+                    [{
+                        "Date": event.at.strftime('%d-%m-%Y %H:%M:%S'),
+                        "Événement": EVENT_LABELS.get(event.kind, event.kind),
+                        "Utilisateur": usernames.get(event.user_id, f"#{event.user_id}"),
+                        "Par": usernames.get(event.actor_id, "") if event.actor_id is not None else "",
+                        "Du": format_date(event.start_date) if event.start_date else "",
+                        "Au": format_date(event.end_date) if event.end_date else "",
+                        "Statut": event.status or "",
+                        "Jours pris": event.used_delta,
+                        "Jours acquis": event.days_delta,
+                    } for event in events],
+                    use_container_width=True,
+                )
+            else:
+                st.write("Aucun événement enregistré.")
+
+        if admin_choice == "Diagnostics":
+            st.subheader("Vue administrateur : Diagnostics")
+
+            st.markdown("### Dernières exécutions")
+            reruns = list(recent_reruns)[::-1]
+            if reruns:
+                st.dataframe(
+                    [{
+                        "Début": datetime.fromtimestamp(rerun["started"]).strftime('%d-%m-%Y %H:%M:%S'),
+                        "Page": rerun.get("page", ""),
+                        "Utilisateur": rerun.get("user", ""),
+                        "Durée (ms)": rerun["total_ms"],
+                        "Requêtes SQL": rerun["queries"],
+                        "Temps DB (ms)": rerun["db_ms"],
+                        "Phases (ms)": ", ".join(f"{name}: {ms:.1f}" for name, ms in rerun["phases"].items()),
+                        "Interrompue": rerun["interrupted"],
+                    } for rerun in reruns],
+                    use_container_width=True,
+                )
+            else:
+                st.write("Aucune exécution enregistrée.")
+
+            st.markdown("### Requêtes lentes")
+            queries = list(slow_queries)[::-1]
+            if queries:
+                st.dataframe(
+                    [{
+                        "Heure": datetime.fromtimestamp(query["at"]).strftime('%d-%m-%Y %H:%M:%S'),
+                        "Durée (ms)": query["duration_ms"],
+                        "Requête": query["statement"],
+                    } for query in queries],
+                    use_container_width=True,
+                )
+            else:
+                st.write("Aucune requête lente.")
+
+            st.markdown("### Caches")
+            st.dataframe([{"Cache": name, **stats} for name, stats in cache_stats().items()], use_container_width=True)
     else:
         # User view (not shown for admin)
         st.subheader("Demande de vacances")
 
+        # Overlap checks on every date change use the in-memory index of the user's vacations
+        if st.session_state.get('overlap_index_user') != user.id:
+            warm_overlap_index(user.id)
+            st.session_state.overlap_index_user = user.id
+
         # Date and time inputs for vacation start and end
         st.session_state.vacation_start_date = st.date_input(
             "Date de début", 
@@ -350,8 +773,15 @@ else:
             value=st.session_state.vacation_end_date or datetime.now().date()
         )
 
-        st.session_state.vacation_start_time = st.selectbox("Heure de début", valid_times, index=valid_times.index(st.session_state.vacation_start_time))
-        st.session_state.vacation_end_time = st.selectbox("Heure de fin", valid_times, index=valid_times.index(st.session_state.vacation_end_time))
+        # Times come from the shift of the user's role; a choice outside it (e.g. after a role change) goes back to the shift edges
+        shift = get_calendar().shift(user.role)
+        shift_times = shift.times()
+        if st.session_state.vacation_start_time not in shift_times:
+            st.session_state.vacation_start_time = shift.start
+        if st.session_state.vacation_end_time not in shift_times:
+            st.session_state.vacation_end_time = shift.end
+        st.session_state.vacation_start_time = st.selectbox("Heure de début", shift_times, index=shift_times.index(st.session_state.vacation_start_time))
+        st.session_state.vacation_end_time = st.selectbox("Heure de fin", shift_times, index=shift_times.index(st.session_state.vacation_end_time))
 
         # Validate selection
         if st.session_state.vacation_start_date and st.session_state.vacation_end_date:
@@ -360,35 +790,36 @@ else:
             elif st.session_state.vacation_start_date == st.session_state.vacation_end_date and st.session_state.vacation_start_time >= st.session_state.vacation_end_time:
                 st.error("L'heure de fin doit être après l'heure de début.")
             else:
-                days_requested = calculate_vacation_days(st.session_state.vacation_start_date, st.session_state.vacation_end_date, st.session_state.vacation_start_time, st.session_state.vacation_end_time)
+                days_requested = calculate_vacation_days(st.session_state.vacation_start_date, st.session_state.vacation_end_date, st.session_state.vacation_start_time, st.session_state.vacation_end_time, get_calendar(), user.role)
                 if days_requested > remaining_days:
                     st.error(f"Vous n'avez que {remaining_days:.4f} jours de vacances restants.")
                 else:
-                    existing_vacations = session.query(Vacation).filter_by(user_id=user.id).all()
-                    overlap = any(
-                        (st.session_state.vacation_start_date <= vacation.end_date and st.session_state.vacation_end_date >= vacation.start_date)
-                        for vacation in existing_vacations
-                    )
-                    if overlap:
-                        st.error("Vous avez déjà des vacances prévues pendant cette période.")
+                    conflicts = find_overlapping_vacations(user.id, st.session_state.vacation_start_date, st.session_state.vacation_end_date)
+                    if conflicts:
+                        st.error("Vous avez déjà des vacances prévues pendant cette période : " + ", ".join(
+                            f"du {format_date(conflict_start)} au {format_date(conflict_end)}" for _, conflict_start, conflict_end in conflicts
+                        ))
                     else:
                         note = st.text_area("Entrez une note pour vos vacances (optionnel)")
                         if st.button("Demander des vacances"):
-                            new_vacation = Vacation(
-                                user_id=user.id,
-                                start_date=st.session_state.vacation_start_date,
-                                end_date=st.session_state.vacation_end_date,
-                                start_time=st.session_state.vacation_start_time,
-                                end_time=st.session_state.vacation_end_time,
-                                status='pending',
-                                note=note
+                            conflicts = submit_vacation(
+                                user.id,
+                                st.session_state.vacation_start_date,
+                                st.session_state.vacation_end_date,
+                                st.session_state.vacation_start_time,
+                                st.session_state.vacation_end_time,
+                                note
                             )
-                            session.add(new_vacation)
-                            session.commit()
-                            st.success("Demande de vacances soumise!")
-                            st.experimental_rerun()
+                            if conflicts:
+                                st.error("Vous avez déjà des vacances prévues pendant cette période : " + ", ".join(
+                                    f"du {format_date(conflict_start)} au {format_date(conflict_end)}" for _, conflict_start, conflict_end in conflicts
+                                ))
+                            else:
+                                st.success("Demande de vacances soumise!")
+                                st.experimental_rerun()
 
         # Overview of all vacation requests
+        render_started = perf_counter()
         st.subheader("Aperçu de vos demandes de vacances")
         vacations = session.query(Vacation).filter_by(user_id=user.id).all()
         if vacations:
@@ -400,4 +831,9 @@ else:
                     unsafe_allow_html=True,
                 )
         else:
-            st.write("Aucune demande de vacances trouvée.")
\ No newline at end of file
+            st.write("Aucune demande de vacances trouvée.")
+        record_phase("render_user_vacations", render_started)
+
+# Write this run's query count and timings, then give its connection back to the pool
+finish_rerun()
+session.remove()
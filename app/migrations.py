@@ -0,0 +1,137 @@
+from datetime import datetime
+
+from sqlalchemy import DateTime, bindparam, select, text
+
+from app.database import (
+    engine, session, Base, User, Vacation, Settings, VacationBalance, RoleOccupancy, WeekendDay, Holiday, RoleShift, AccrualPeriod, VacationEvent, BalanceSnapshot,
+    VacationGeneration,
+    rebuild_occupancy, invalidate_calendar, get_calendar,
+)
+from app.vacation_days import calculate_vacation_days_batch
+from app.work_calendar import DEFAULT_WEEKEND
+
+# Versioned schema migrations. The applied version is stored in SQLite's PRAGMA user_version;
+# a database from before migrations existed has version 0 and every step is safe to run on it.
+# Data steps select explicit columns that exist at their version, never whole mapped entities,
+# so columns added to the models later cannot break them.
+
+def _create_tables(*models):
+    Base.metadata.create_all(bind=engine, tables=[model.__table__ for model in models])
+
+def _create_indexes(model):
+    for index in model.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+# Function to rebuild every user's balance row from the approved vacations (no events are logged)
+def _rebuild_balances():
+    users, vacations = User.__table__.c, Vacation.__table__.c
+    rows = session.execute(
+        select(vacations.user_id, users.role, vacations.start_date, vacations.end_date, vacations.start_time, vacations.end_time)
+        .join_from(Vacation.__table__, User.__table__, vacations.user_id == users.id)
+        .where(vacations.status == 'approved')
+    ).all()
+    used_by_user = {}
+    if rows:
+        user_ids, roles, start_dates, end_dates, start_times, end_times = zip(*rows)
+        days = calculate_vacation_days_batch(start_dates, end_dates, start_times, end_times, get_calendar(), roles)
+        for user_id, used_days in zip(user_ids, days.tolist()):
+            used_by_user[user_id] = used_by_user.get(user_id, 0.0) + used_days
+
+    balances = []
+    for user_id, vacation_days in session.execute(select(users.id, users.vacation_days)):
+        used_days = used_by_user.get(user_id, 0.0)
+        balances.append({"user_id": user_id, "used_days": used_days, "remaining_days": (vacation_days or 0) - used_days})
+    session.execute(VacationBalance.__table__.delete())
+    if balances:
+        session.execute(VacationBalance.__table__.insert(), balances)
+    session.commit()
+
+def _add_vacation_balances():
+    _create_tables(VacationBalance)
+    _rebuild_balances()
+
+def _add_role_occupancy():
+    _create_tables(RoleOccupancy)
+    rebuild_occupancy()
+
+def _add_work_calendar():
+    _create_tables(WeekendDay, Holiday, RoleShift)
+    if session.execute(select(WeekendDay.__table__.c.weekday)).first() is None:
+        session.execute(WeekendDay.__table__.insert(), [{"weekday": weekday} for weekday in DEFAULT_WEEKEND])
+        session.commit()
+    invalidate_calendar()
+    _rebuild_balances()  # weekends no longer count as vacation days
+
+def _add_event_log():
+    _create_tables(VacationEvent, BalanceSnapshot)
+    # Starting point of the history: the balance of every user before the first event
+    session.execute(
+        text(
+            "INSERT OR IGNORE INTO balance_snapshots (user_id, event_id, taken_at, vacation_days, used_days) "
+            "SELECT users.id, 0, :now, COALESCE(users.vacation_days, 0), COALESCE(vacation_balances.used_days, 0) "
+            "FROM users LEFT JOIN vacation_balances ON vacation_balances.user_id = users.id"
+        ).bindparams(bindparam("now", type_=DateTime)),
+        {"now": datetime.now()},
+    )
+    session.commit()
+
+def _add_token_version():
+    with engine.begin() as connection:
+        columns = [row[1] for row in connection.exec_driver_sql("PRAGMA table_info(users)")]
+        if columns and "token_version" not in columns:
+            connection.exec_driver_sql("ALTER TABLE users ADD COLUMN token_version INTEGER NOT NULL DEFAULT 0")
+
+# Raise the generation of a user; used by the triggers below
+_BUMP_GENERATION = """
+    INSERT INTO vacation_generations (user_id, generation) VALUES ({user_id}, 1)
+    ON CONFLICT (user_id) DO UPDATE SET generation = generation + 1;
+"""
+
+VACATION_TRIGGERS = {
+    "vacations_generation_insert": "AFTER INSERT ON vacations BEGIN" + _BUMP_GENERATION.format(user_id="NEW.user_id") + "END",
+    "vacations_generation_update": "AFTER UPDATE OF user_id, start_date, end_date ON vacations BEGIN"
+        + _BUMP_GENERATION.format(user_id="OLD.user_id")
+        + "INSERT INTO vacation_generations (user_id, generation) SELECT NEW.user_id, 1 WHERE NEW.user_id IS NOT OLD.user_id"
+        + " ON CONFLICT (user_id) DO UPDATE SET generation = generation + 1;"
+        + " END",
+    "vacations_generation_delete": "AFTER DELETE ON vacations BEGIN" + _BUMP_GENERATION.format(user_id="OLD.user_id") + "END",
+}
+
+def _add_vacation_generations():
+    _create_tables(VacationGeneration)
+    with engine.begin() as connection:
+        for name, body in VACATION_TRIGGERS.items():
+            connection.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+# (version, description, upgrade function) in the order they are applied
+MIGRATIONS = [
+    (1, "users, vacations and settings tables", lambda: _create_tables(User, Vacation, Settings)),
+    (2, "vacation balance ledger", _add_vacation_balances),
+    (3, "day x role occupancy table", _add_role_occupancy),
+    (4, "vacation indexes for the processed requests history", lambda: _create_indexes(Vacation)),
+    (5, "working-day calendar (weekends, holidays, shifts per role)", _add_work_calendar),
+    (6, "monthly accrual periods", lambda: _create_tables(AccrualPeriod)),
+    (7, "vacation index for overlap checks", lambda: _create_indexes(Vacation)),
+    (8, "vacation event log and balance snapshots", _add_event_log),
+    (9, "session token version per user", _add_token_version),
+    (10, "vacation change counter per user (overlap index)", _add_vacation_generations),
+]
+
+def current_version():
+    with engine.connect() as connection:
+        return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+def _set_version(version):
+    with engine.begin() as connection:
+        connection.exec_driver_sql(f"PRAGMA user_version = {int(version)}")
+
+# Function to apply all migrations newer than the database; returns the applied (version, description) pairs
+def migrate():
+    version = current_version()
+    applied = []
+    for migration_version, description, upgrade in MIGRATIONS:
+        if migration_version > version:
+            upgrade()
+            _set_version(migration_version)
+            applied.append((migration_version, description))
+    return applied
@@ -0,0 +1,80 @@
+import threading
+from datetime import timedelta
+
+from cachetools import TTLCache
+from sortedcontainers import SortedKeyList
+
+from app.database import SessionLocal, Vacation, VacationGeneration, session
+
+# Vacations of one user sorted by start date, for overlap queries in O(log n + conflicts).
+# Candidates are the vacations starting between (start - longest vacation) and end; the ones
+# that also end on or after start overlap.
+class VacationIntervals:
+    def __init__(self, entries=()):
+        self._entries = SortedKeyList(key=lambda entry: entry[1])
+        self._by_id = {}
+        self._longest = timedelta(0)
+        for vacation_id, start_date, end_date in entries:
+            self.add(vacation_id, start_date, end_date)
+
+    def add(self, vacation_id, start_date, end_date):
+        self.discard(vacation_id)
+        entry = (vacation_id, start_date, end_date)
+        self._entries.add(entry)
+        self._by_id[vacation_id] = entry
+        self._longest = max(self._longest, end_date - start_date)
+
+    def discard(self, vacation_id):
+        entry = self._by_id.pop(vacation_id, None)
+        if entry is not None:
+            self._entries.remove(entry)
+
+    # (vacation id, start date, end date) of every vacation overlapping the range, by start date
+    def overlapping(self, start_date, end_date):
+        candidates = self._entries.irange_key(start_date - self._longest, end_date)
+        return [entry for entry in candidates if entry[2] >= start_date]
+
+
+# Index per user id with the generation of the user's vacations it was built at (see VacationGeneration).
+# Before it answers, the generation is read from the database; if any process changed the user's
+# vacations since, the index is rebuilt, so it can never miss a conflict.
+_indexes = TTLCache(maxsize=4096, ttl=3600)
+_lock = threading.Lock()
+
+# Function to read the current generation of a user's vacations
+def _current_generation(query_session, user_id):
+    return query_session.query(VacationGeneration.generation).filter(VacationGeneration.user_id == user_id).scalar() or 0
+
+# Function to load the index of a user; the generation is read first, so the rows are never older than it
+def _load_index(query_session, user_id):
+    generation = _current_generation(query_session, user_id)
+    rows = query_session.query(Vacation.id, Vacation.start_date, Vacation.end_date).filter(Vacation.user_id == user_id).all()
+    intervals = VacationIntervals(rows)
+    with _lock:
+        _indexes[user_id] = (generation, intervals)
+    return intervals
+
+# Function to build the index of a user if it is not there yet
+def warm_overlap_index(user_id):
+    with _lock:
+        if user_id in _indexes:
+            return
+    with SessionLocal() as load_session:
+        _load_index(load_session, user_id)
+
+# Function to find the vacations of a user that overlap a date range; returns (id, start date, end date) tuples.
+# Uses the in-memory index while the user's vacations are unchanged, otherwise reloads it first.
+def find_overlapping_vacations(user_id, start_date, end_date):
+    generation = _current_generation(session, user_id)
+    with _lock:
+        cached = _indexes.get(user_id)
+    if cached is not None and cached[0] == generation:
+        intervals = cached[1]
+    else:
+        intervals = _load_index(session, user_id)
+    return intervals.overlapping(start_date, end_date)
+
+# Function to drop all indexes
+def clear_overlap_indexes():
+    with _lock:
+        _indexes.clear()
@@ -0,0 +1,26 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import init_db, reconcile_balances, rebuild_occupancy
+
+# Salden aus der Urlaubstabelle neu aufbauen; mit --check wird nur geprüft, nicht korrigiert
+check_only = "--check" in sys.argv[1:]
+
+init_db()
+drift = reconcile_balances(fix=not check_only)
+
+for username, stored_days, actual_days in drift:
+    stored = "missing" if stored_days is None else f"{stored_days:.4f}"
+    print(f"{username}: stored used days {stored}, actual {actual_days:.4f}")
+
+if not drift:
+    print("All balances are consistent.")
+elif check_only:
+    print(f"{len(drift)} balance(s) drifted (not fixed, run without --check to repair).")
+else:
+    print(f"{len(drift)} balance(s) rebuilt.")
+
+if not check_only:
+    rebuild_occupancy()
+    print("Occupancy table rebuilt.")
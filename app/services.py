@@ -0,0 +1,230 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import joinedload
+
+from app.database import (
+    session, User, Vacation, VacationGeneration, get_user, get_balance, get_settings, get_calendar, role_limit, max_occupancy,
+    plan_approvals, create_vacation, change_vacation, remove_vacation, retry_on_locked,
+)
+from app.overlap_index import VacationIntervals
+from app.vacation_days import calculate_vacation_days_batch
+
+# Vacation domain functions shared by the Streamlit app (app/main.py) and the JSON API (app/api.py).
+# Every write function is one transaction.
+
+# Function to get used vacation days (read from the balance ledger)
+def calculate_used_vacation_days(user_id):
+    user = get_user(user_id)
+    return get_balance(user).used_days
+
+# Function to get remaining vacation days (read from the balance ledger)
+def calculate_remaining_vacation_days(user_id):
+    user = get_user(user_id)
+    return get_balance(user).remaining_days
+
+# Function to get the balances of many users in one query; returns [(user, balance), ...] for the users that exist
+@retry_on_locked
+def get_balances(user_ids):
+    users = session.query(User).options(joinedload(User.balance)).filter(User.id.in_(user_ids)).order_by(User.id).all()
+    balances = [(user, user.balance or get_balance(user)) for user in users]
+    session.commit()  # keeps ledger rows created for users that had none
+    return balances
+
+# Function to check vacation limits
+def check_vacation_limits(user_role, start_date, end_date):
+    limit = role_limit(get_settings(), user_role)
+    if limit is None:
+        return True  # No limit for other roles
+
+    # Busiest day of the range, read from the day x role occupancy table
+    return max_occupancy(user_role, start_date, end_date) < limit
+
+# Function to raise the vacation generation of users before their vacations are read for an overlap check.
+# It is a write, so the transaction holds SQLite's write lock from here on and no other process can add
+# an overlapping vacation before the commit.
+def _lock_users(user_ids):
+    statement = sqlite_insert(VacationGeneration).on_conflict_do_update(
+        index_elements=[VacationGeneration.user_id], set_={"generation": VacationGeneration.generation + 1},
+    )
+    session.execute(statement, [{"user_id": user_id, "generation": 1} for user_id in user_ids])
+
+# Function to find a user's vacations that overlap a date range, in SQL; returns (id, start date, end date) tuples
+def _overlapping_vacations(user_id, start_date, end_date):
+    rows = (
+        session.query(Vacation.id, Vacation.start_date, Vacation.end_date)
+        .filter(Vacation.user_id == user_id, Vacation.start_date <= end_date, Vacation.end_date >= start_date)
+        .order_by(Vacation.start_date)
+        .all()
+    )
+    return [tuple(row) for row in rows]
+
+# Function to submit a new vacation request. The page checks overlaps before, but against what it saw then,
+# so the check runs again in the same transaction. Returns the conflicting vacations ([] when submitted).
+@retry_on_locked
+def submit_vacation(user_id, start_date, end_date, start_time, end_time, note):
+    _lock_users([user_id])
+    conflicts = _overlapping_vacations(user_id, start_date, end_date)
+    if conflicts:
+        session.rollback()
+        return conflicts
+    create_vacation(
+        user_id=user_id,
+        start_date=start_date,
+        end_date=end_date,
+        start_time=start_time,
+        end_time=end_time,
+        note=note
+    )
+    session.commit()
+    return []
+
+# Reason why a request cannot be submitted before looking at other vacations, or None.
+# Times must be on the half-hour grid of the user's shift, like the choices of the request form.
+def _request_error(request, user, calendar):
+    if user is None:
+        return "unknown user"
+    if request["end_date"] < request["start_date"]:
+        return "end_date is before start_date"
+    shift = calendar.shift(user.role)
+    shift_times = shift.times()
+    for field in ("start_time", "end_time"):
+        if request.get(field) and request[field] not in shift_times:
+            return f"{field} must be within the {shift.start:%H:%M}-{shift.end:%H:%M} shift, on the half hour"
+    if request["start_date"] == request["end_date"] and request.get("start_time") and request.get("end_time") and request["start_time"] >= request["end_time"]:
+        return "end_time must be after start_time"
+    return None
+
+# Function to submit many vacation requests in one transaction.
+# Each request is a dict with user_id, start_date, end_date and optionally start_time, end_time and note.
+# The same checks as the request form run for all of them with batched queries: the days must fit in the
+# remaining balance and must not overlap another vacation of the user (including earlier requests of the batch).
+# Returns (created vacations, [(index of the request, error), ...]).
+@retry_on_locked
+def submit_vacations(requests):
+    users = {
+        user.id: user
+        for user in session.query(User).options(joinedload(User.balance)).filter(User.id.in_({request["user_id"] for request in requests}))
+    }
+
+    calendar = get_calendar()
+    rejected = []
+    valid = []
+    for index, request in enumerate(requests):
+        error = _request_error(request, users.get(request["user_id"]), calendar)
+        if error:
+            rejected.append((index, error))
+        else:
+            valid.append((index, request))
+
+    # Missing times mean the whole shift of the user's role
+    for _, request in valid:
+        shift = calendar.shift(users[request["user_id"]].role)
+        request["start_time"] = request.get("start_time") or shift.start
+        request["end_time"] = request.get("end_time") or shift.end
+
+    created = []
+    if valid:
+        first_day = min(request["start_date"] for _, request in valid)
+        last_day = max(request["end_date"] for _, request in valid)
+        user_ids = {request["user_id"] for _, request in valid}
+
+        # Existing vacations of these users around the requested dates, in one query (under the write lock)
+        _lock_users(user_ids)
+        intervals = defaultdict(VacationIntervals)
+        existing = session.query(Vacation.user_id, Vacation.id, Vacation.start_date, Vacation.end_date).filter(
+            Vacation.user_id.in_(user_ids), Vacation.start_date <= last_day, Vacation.end_date >= first_day,
+        )
+        for user_id, vacation_id, start_date, end_date in existing:
+            intervals[user_id].add(vacation_id, start_date, end_date)
+
+        remaining = {user_id: (users[user_id].balance or get_balance(users[user_id])).remaining_days for user_id in user_ids}
+        days_requested = calculate_vacation_days_batch(
+            [request["start_date"] for _, request in valid],
+            [request["end_date"] for _, request in valid],
+            [request["start_time"] for _, request in valid],
+            [request["end_time"] for _, request in valid],
+            calendar,
+            [users[request["user_id"]].role for _, request in valid],
+        )
+
+        for (index, request), days in zip(valid, days_requested):
+            user_id = request["user_id"]
+            conflicts = intervals[user_id].overlapping(request["start_date"], request["end_date"])
+            if conflicts:
+                rejected.append((index, f"overlaps vacation {conflicts[0][0]}"))
+                continue
+            if days > remaining[user_id] + 1e-9:
+                rejected.append((index, f"only {remaining[user_id]:.4f} vacation days remaining"))
+                continue
+            vacation = create_vacation(
+                user_id=user_id,
+                start_date=request["start_date"],
+                end_date=request["end_date"],
+                start_time=request["start_time"],
+                end_time=request["end_time"],
+                note=request.get("note"),
+            )
+            intervals[user_id].add(vacation.id, vacation.start_date, vacation.end_date)
+            created.append(vacation)
+
+    session.commit()
+    return created, sorted(rejected)
+
+# Function to approve pending vacations in one transaction; the role limits are checked for the whole set in one pass.
+# Returns (approved vacations, [(vacation, first day over the limit), ...] for the others).
+@retry_on_locked
+def approve_vacations(vacation_ids):
+    vacations = (
+        session.query(Vacation)
+        .options(joinedload(Vacation.user))
+        .filter(Vacation.id.in_(vacation_ids), Vacation.status == 'pending')
+        .order_by(Vacation.id)
+        .all()
+    )
+    accepted, blocked = plan_approvals(vacations)
+    for vacation in accepted:
+        change_vacation(vacation, status='approved')
+    session.commit()
+    return accepted, blocked
+
+# Function to deny vacations in one transaction; returns the denied vacations
+@retry_on_locked
+def deny_vacations(vacation_ids):
+    vacations = session.query(Vacation).options(joinedload(Vacation.user)).filter(Vacation.id.in_(vacation_ids)).all()
+    for vacation in vacations:
+        change_vacation(vacation, status='denied')
+    session.commit()
+    return vacations
+
+# Function to change the status, dates or times of a vacation
+@retry_on_locked
+def update_vacation(vacation_id, **changes):
+    vacation = session.get(Vacation, vacation_id)
+    if vacation is not None:
+        change_vacation(vacation, **changes)
+    session.commit()
+
+# Function to move vacations by a number of days in one transaction
+@retry_on_locked
+def shift_vacations(vacation_ids, days):
+    for vacation in session.query(Vacation).filter(Vacation.id.in_(vacation_ids)).all():
+        change_vacation(vacation, start_date=vacation.start_date + timedelta(days=days), end_date=vacation.end_date + timedelta(days=days))
+    session.commit()
+
+# Function to delete a specific vacation
+@retry_on_locked
+def delete_vacation(vacation_id):
+    remove_vacation(vacation_id)
+    session.commit()
+
+# Function to delete many vacations in one transaction; returns the ids that existed
+@retry_on_locked
+def delete_vacations(vacation_ids):
+    # Load them together with their users first, remove_vacation then finds them in the session
+    vacations = session.query(Vacation).options(joinedload(Vacation.user)).filter(Vacation.id.in_(vacation_ids)).all()
+    for vacation in vacations:
+        remove_vacation(vacation.id)
+    session.commit()
+    return [vacation.id for vacation in vacations]
@@ -0,0 +1,11 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import init_db
+from app.balance_history import snapshot_balances
+
+# Salden aller Benutzer als Ausgangspunkt für historische Abfragen festhalten (z.B. nächtlich per cron)
+init_db()
+count = snapshot_balances()
+print(f"Balance snapshot taken for {count} user(s).")
@@ -1,15 +1,237 @@
+import csv
+import hashlib
+import hmac
+import io
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from cachetools import TTLCache
+from openpyxl import load_workbook
 from werkzeug.security import generate_password_hash, check_password_hash
-from app.database import session, User
+from app.database import (
+    session, User, VacationBalance, VacationEvent, ROLES, retry_on_locked, get_user_by_username, invalidate_user,
+    log_event, current_actor,
+)
+
+# Password checks run in a small bounded pool so a burst of logins cannot occupy every CPU.
+# Threads are enough because hashlib.pbkdf2_hmac releases the GIL.
+PASSWORD_WORKERS = min(4, os.cpu_count() or 1)
+_password_pool = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix="password-check")
+# Imports hash in their own pool, so a large file never queues in front of logins at shift start.
+# It gets the CPUs the login pool leaves free, but at least two threads.
+IMPORT_WORKERS = max(2, (os.cpu_count() or 1) - PASSWORD_WORKERS)
+_import_pool = ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix="import-hash")
+
+# Failed logins per username: after MAX_FAILED_LOGINS within FAILED_LOGIN_WINDOW seconds no more hashes are computed
+MAX_FAILED_LOGINS = 5
+FAILED_LOGIN_WINDOW = 300
+_failed_logins = TTLCache(maxsize=10000, ttl=FAILED_LOGIN_WINDOW)
+_failed_logins_lock = threading.Lock()
+
+# Signed session tokens let a page refresh log the user back in without hashing the password again
+SESSION_TOKEN_LIFETIME = 8 * 3600
+SECRET_KEY = os.environ.get("VACATION_MANAGER_SECRET", "").encode() or secrets.token_bytes(32)
+
+# Rows per transaction when importing users
+IMPORT_BATCH_SIZE = 500
+
+def hash_password(password):
+    return generate_password_hash(password, method='pbkdf2:sha256')
 
+@retry_on_locked
 def register_user(username, email, password, vacation_days, role, monthly_vacation_days):
-    hashed_password = generate_password_hash(password, method='pbkdf2:sha256')
+    hashed_password = hash_password(password)
     new_user = User(username=username, email=email, hashed_password=hashed_password, vacation_days=vacation_days, role=role, monthly_vacation_days=monthly_vacation_days)
+    new_user.balance = VacationBalance(used_days=0.0, remaining_days=vacation_days)
     session.add(new_user)
+    session.flush()
+    log_event('adjust', new_user.id, days_delta=vacation_days)
     session.commit()
+    invalidate_user(new_user.id, username)
     print(f"Registered user {username} with {vacation_days} vacation days and role {role}")
 
+# Read the rows of a CSV or XLSX file one by one as dicts (header row gives the column names)
+def _read_user_rows(file, filename):
+    if not isinstance(file, str):
+        file.seek(0)  # the file is read twice (validation, then import)
+    if filename.lower().endswith(".xlsx"):
+        workbook = load_workbook(file, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [str(name or "").strip().lower() for name in next(rows, ())]
+            for values in rows:
+                yield dict(zip(header, ("" if value is None else str(value).strip() for value in values)))
+        finally:
+            workbook.close()
+    elif isinstance(file, str):
+        with open(file, newline="", encoding="utf-8-sig") as text:
+            yield from _csv_rows(text)
+    else:
+        text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+        try:
+            yield from _csv_rows(text)
+        finally:
+            text.detach()  # keep the uploaded file open for the second pass
+
+def _csv_rows(text):
+    for row in csv.DictReader(text):
+        yield {str(name or "").strip().lower(): (value or "").strip() for name, value in row.items()}
+
+# Check one row against the rows seen before; returns (values for the users table, None) or (None, error message)
+def _validate_user_row(row, seen_usernames, seen_emails):
+    username, email, password, role = row.get("username", ""), row.get("email", ""), row.get("password", ""), row.get("role", "")
+    if not username or not email or not password:
+        return None, "username, email and password are required"
+    if role not in ROLES:
+        return None, f"unknown role '{role}'"
+    try:
+        vacation_days = float(row.get("vacation_days") or 0)
+        monthly_vacation_days = float(row.get("monthly_vacation_days") or 2)
+    except ValueError:
+        return None, "vacation_days and monthly_vacation_days must be numbers"
+    if username in seen_usernames:
+        return None, f"duplicate username '{username}'"
+    if email in seen_emails:
+        return None, f"duplicate email '{email}'"
+    return {
+        "username": username,
+        "email": email,
+        "hashed_password": password,  # replaced by the hash before inserting
+        "vacation_days": vacation_days,
+        "role": role,
+        "monthly_vacation_days": monthly_vacation_days,
+    }, None
+
+@retry_on_locked
+def _insert_user_batch(users):
+    session.execute(User.__table__.insert(), users)
+    ids = session.query(User.id, User.vacation_days).filter(User.username.in_([user["username"] for user in users])).all()
+    session.execute(VacationBalance.__table__.insert(), [
+        {"user_id": user_id, "used_days": 0.0, "remaining_days": vacation_days} for user_id, vacation_days in ids
+    ])
+    now = datetime.now()
+    session.execute(VacationEvent.__table__.insert(), [
+        {"at": now, "kind": "adjust", "user_id": user_id, "actor_id": current_actor(), "used_delta": 0.0, "days_delta": vacation_days}
+        for user_id, vacation_days in ids
+    ])
+    session.commit()
+
+# Function to find the usernames and emails of the file that already exist, in chunked queries.
+# Takes {username: row number} and {email: (row number, username)}; returns (row number, username, error) tuples.
+def _existing_user_errors(usernames, emails):
+    errors = []
+    names = list(usernames)
+    for i in range(0, len(names), IMPORT_BATCH_SIZE):
+        for (username,) in session.query(User.username).filter(User.username.in_(names[i:i + IMPORT_BATCH_SIZE])):
+            errors.append((usernames[username], username, "username already exists"))
+    addresses = list(emails)
+    for i in range(0, len(addresses), IMPORT_BATCH_SIZE):
+        for (email,) in session.query(User.email).filter(User.email.in_(addresses[i:i + IMPORT_BATCH_SIZE])):
+            errors.append((*emails[email], "email already exists"))
+    return errors
+
+def _hash_and_insert(batch):
+    for values, hashed_password in zip(batch, _import_pool.map(hash_password, [values["hashed_password"] for values in batch])):
+        values["hashed_password"] = hashed_password
+    _insert_user_batch(batch)
+
+# Function to import users from a CSV or XLSX file (path or file object).
+# Columns: username, email, password, vacation_days, role, monthly_vacation_days.
+# A first pass over the file checks every row (required fields, roles, duplicates in the file and in the
+# database); if any row is wrong nothing is imported. The second pass inserts in batched transactions.
+# Returns the number of imported users and a list of (row number, username, error) for the wrong rows.
+def import_users(file, filename=None):
+    filename = filename or (file if isinstance(file, str) else getattr(file, "name", ""))
+
+    report = []
+    usernames, emails = {}, {}
+    for row_number, row in enumerate(_read_user_rows(file, filename), start=2):
+        if not any(row.values()):
+            continue
+        values, error = _validate_user_row(row, usernames, emails)
+        if error:
+            report.append((row_number, row.get("username", ""), error))
+        else:
+            usernames[values["username"]] = row_number
+            emails[values["email"]] = (row_number, values["username"])
+    report += _existing_user_errors(usernames, emails)
+    if report:
+        session.rollback()
+        return 0, sorted(report)
+
+    imported = 0
+    batch = []
+    for row in _read_user_rows(file, filename):
+        if not any(row.values()):
+            continue
+        values, _ = _validate_user_row(row, (), ())
+        batch.append(values)
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            _hash_and_insert(batch)
+            imported += len(batch)
+            batch = []
+    if batch:
+        _hash_and_insert(batch)
+        imported += len(batch)
+    return imported, []
+
+# Recent failure times of a username (older ones are dropped)
+def _recent_failures(username, now):
+    return [failed_at for failed_at in _failed_logins.get(username, []) if now - failed_at < FAILED_LOGIN_WINDOW]
+
+def login_locked(username):
+    with _failed_logins_lock:
+        return len(_recent_failures(username, time.time())) >= MAX_FAILED_LOGINS
+
+def _record_failed_login(username):
+    with _failed_logins_lock:
+        now = time.time()
+        _failed_logins[username] = _recent_failures(username, now) + [now]
+
 def login_user(username, password):
-    user = session.query(User).filter_by(username=username).first()
-    if user and check_password_hash(user.hashed_password, password):
+    if login_locked(username):
+        return None
+    user = get_user_by_username(username)
+    # hashlib releases the GIL, so the pool threads hash in parallel while this script thread only waits
+    if user and _password_pool.submit(check_password_hash, user.hashed_password, password).result():
+        with _failed_logins_lock:
+            _failed_logins.pop(username, None)
         return user
+    _record_failed_login(username)
     return None
+
+def _sign(payload):
+    return hmac.new(SECRET_KEY, payload.encode(), hashlib.sha256).hexdigest()
+
+# Function to create a signed token "<user_id>.<token version>.<expires>.<signature>" after a successful login
+def create_session_token(user):
+    payload = f"{user.id}.{user.token_version or 0}.{int(time.time()) + SESSION_TOKEN_LIFETIME}"
+    return f"{payload}.{_sign(payload)}"
+
+# Function to check a session token; returns the user id or None if it is invalid, expired or revoked
+def verify_session_token(token):
+    try:
+        user_id, version, expires, signature = token.split(".")
+        if not hmac.compare_digest(signature, _sign(f"{user_id}.{version}.{expires}")) or int(expires) < time.time():
+            return None
+        user_id, version = int(user_id), int(version)
+    except (AttributeError, ValueError):
+        return None
+    # Read from the database, not the user cache, so a logout in another process counts too
+    current_version = session.query(User.token_version).filter(User.id == user_id).scalar()
+    return user_id if current_version == version else None
+
+# Function to revoke every session token of a user (logout)
+@retry_on_locked
+def revoke_session_tokens(user_id):
+    user = session.get(User, user_id)
+    if user is None:
+        session.rollback()
+        return
+    user.token_version = (user.token_version or 0) + 1
+    session.commit()
+    invalidate_user(user.id, user.username)
@@ -0,0 +1,104 @@
+from datetime import datetime, date, timedelta
+
+import numpy as np
+
+from app.work_calendar import DEFAULT_CALENDAR, EPOCH_ORDINAL
+
+# Function to calculate the exact number of vacation days based on times.
+# Only working days of the calendar count; the shift and lunch break are the ones of the role.
+def calculate_vacation_days(start_date, end_date, start_time, end_time, calendar=None, role=None):
+    calendar = calendar or DEFAULT_CALENDAR
+    shift = calendar.shift(role)
+    day_hours = shift.hours
+    full_days = (end_date - start_date).days
+    total_days = 0.0
+
+    lunch_hours = 0.0
+    if start_time <= shift.lunch_start and end_time > shift.lunch_end:
+        lunch_hours = shift.lunch_hours  # Deduct lunch break if it falls within the vacation period
+
+    if full_days > 0:
+        if calendar.is_working_day(start_date):
+            first_day_hours = (datetime.combine(date.today(), shift.end) - datetime.combine(date.today(), start_time)).seconds / 3600.0
+            first_day_hours -= lunch_hours
+            total_days += first_day_hours / day_hours
+
+        total_days += calendar.working_days(start_date + timedelta(days=1), end_date - timedelta(days=1))
+
+        if calendar.is_working_day(end_date):
+            last_day_hours = (datetime.combine(date.today(), end_time) - datetime.combine(date.today(), shift.start)).seconds / 3600.0
+            last_day_hours -= lunch_hours
+            total_days += last_day_hours / day_hours
+    elif calendar.is_working_day(start_date):
+        work_hours = (datetime.combine(date.today(), end_time) - datetime.combine(date.today(), start_time)).seconds / 3600.0
+        work_hours -= lunch_hours
+        total_days += work_hours / day_hours
+
+    return round(total_days, 4)
+
+
+# Seconds since midnight for a sequence of times (-1 for missing times)
+def _to_seconds(times):
+    if isinstance(times, np.ndarray) and times.dtype.kind in 'iuf':
+        return times.astype(np.int64)
+    return np.fromiter(
+        (-1 if t is None else t.hour * 3600 + t.minute * 60 + t.second for t in times),
+        dtype=np.int64,
+        count=len(times),
+    )
+
+# Date ordinals for a sequence of dates
+def _to_day_numbers(dates):
+    if isinstance(dates, np.ndarray):
+        return dates.astype('datetime64[D]').astype(np.int64) + EPOCH_ORDINAL
+    return np.fromiter((d.toordinal() for d in dates), dtype=np.int64, count=len(dates))
+
+# Shift start, shift end, lunch start, lunch end (seconds), lunch hours and paid hours per row
+def _shift_arrays(calendar, roles, count):
+    if roles is None:
+        codes = np.zeros(count, dtype=np.int64)
+        shifts = [calendar.shift(None)]
+    else:
+        # One entry per distinct role, rows point to it
+        positions = {}
+        codes = np.fromiter((positions.setdefault(role, len(positions)) for role in roles), dtype=np.int64, count=count)
+        shifts = [calendar.shift(role) for role in positions] or [calendar.shift(None)]
+    columns = [
+        [s.start.hour * 3600 + s.start.minute * 60 + s.start.second for s in shifts],
+        [s.end.hour * 3600 + s.end.minute * 60 + s.end.second for s in shifts],
+        [s.lunch_start.hour * 3600 + s.lunch_start.minute * 60 + s.lunch_start.second for s in shifts],
+        [s.lunch_end.hour * 3600 + s.lunch_end.minute * 60 + s.lunch_end.second for s in shifts],
+        [s.lunch_hours for s in shifts],
+        [s.hours for s in shifts],
+    ]
+    return [np.array(column)[codes] for column in columns]
+
+# Vectorized version of calculate_vacation_days: takes sequences of dates and times (and optionally the role
+# of every row), returns a NumPy array of day counts
+def calculate_vacation_days_batch(start_dates, end_dates, start_times, end_times, calendar=None, roles=None):
+    calendar = calendar or DEFAULT_CALENDAR
+    start_days = _to_day_numbers(start_dates)
+    end_days = _to_day_numbers(end_dates)
+    shift_start, shift_end, lunch_start, lunch_end, lunch_hours, day_hours = _shift_arrays(calendar, roles, len(start_days))
+
+    # Missing times default to the shift edges
+    start_seconds = _to_seconds(start_times)
+    start_seconds = np.where(start_seconds < 0, shift_start, start_seconds)
+    end_seconds = _to_seconds(end_times)
+    end_seconds = np.where(end_seconds < 0, shift_end, end_seconds)
+
+    full_days = end_days - start_days
+    lunch = np.where((start_seconds <= lunch_start) & (end_seconds > lunch_end), lunch_hours, 0.0)
+    first_working = calendar.is_working_batch(start_days)
+    last_working = calendar.is_working_batch(end_days)
+    middle_days = calendar.working_days_batch(start_days + 1, end_days - 1)
+
+    # Same operation order as the scalar function so the floating point results are identical
+    first_day_hours = np.mod(shift_end - start_seconds, 86400) / 3600.0 - lunch
+    last_day_hours = np.mod(end_seconds - shift_start, 86400) / 3600.0 - lunch
+    work_hours = np.mod(end_seconds - start_seconds, 86400) / 3600.0 - lunch
+
+    multi_day = np.where(first_working, first_day_hours / day_hours, 0.0) + middle_days + np.where(last_working, last_day_hours / day_hours, 0.0)
+    single_day = np.where(first_working, work_hours / day_hours, 0.0)
+
+    return np.round(np.where(full_days > 0, multi_day, single_day), 4)
@@ -0,0 +1,77 @@
+import csv
+import io
+
+from sqlalchemy import select
+
+from app.database import session, User, Vacation, get_calendar
+from app.vacation_days import calculate_vacation_days_batch
+
+EXPORT_COLUMNS = ("vacation_id", "username", "email", "role", "start_date", "end_date", "start_time", "end_time", "status", "note", "days")
+EXPORT_CHUNK_SIZE = 5000
+
+# Yield the vacation history (joined with users) in chunks of column lists, with the day counts computed per chunk
+def iter_vacation_chunks(start_date=None, end_date=None, role=None, chunk_size=EXPORT_CHUNK_SIZE):
+    query = (
+        select(
+            Vacation.id, User.username, User.email, User.role,
+            Vacation.start_date, Vacation.end_date, Vacation.start_time, Vacation.end_time,
+            Vacation.status, Vacation.note,
+        )
+        .join(User, Vacation.user_id == User.id)
+        .order_by(Vacation.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    if start_date is not None:
+        query = query.where(Vacation.end_date >= start_date)
+    if end_date is not None:
+        query = query.where(Vacation.start_date <= end_date)
+    if role:
+        query = query.where(User.role == role)
+
+    result = session.execute(query)
+    try:
+        for rows in result.partitions():
+            columns = [list(column) for column in zip(*rows)]
+            days = calculate_vacation_days_batch(columns[4], columns[5], columns[6], columns[7], get_calendar(), columns[3])
+            yield dict(zip(EXPORT_COLUMNS, columns + [days.tolist()]))
+    finally:
+        result.close()
+
+def _write_csv(out, chunks):
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="", write_through=True)
+    writer = csv.writer(text)
+    writer.writerow(EXPORT_COLUMNS)
+    for chunk in chunks:
+        writer.writerows(zip(*(chunk[column] for column in EXPORT_COLUMNS)))
+    text.detach()
+
+def _write_parquet(out, chunks):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("vacation_id", pa.int64()),
+        ("username", pa.string()),
+        ("email", pa.string()),
+        ("role", pa.string()),
+        ("start_date", pa.date32()),
+        ("end_date", pa.date32()),
+        ("start_time", pa.time64("us")),
+        ("end_time", pa.time64("us")),
+        ("status", pa.string()),
+        ("note", pa.string()),
+        ("days", pa.float64()),
+    ])
+    with pq.ParquetWriter(out, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pydict(chunk, schema=schema))
+
+# Function to export the vacation history to a binary file object as CSV or Parquet, one chunk at a time
+def export_vacations(out, file_format="csv", start_date=None, end_date=None, role=None, chunk_size=EXPORT_CHUNK_SIZE):
+    chunks = iter_vacation_chunks(start_date, end_date, role, chunk_size)
+    if file_format == "parquet":
+        _write_parquet(out, chunks)
+    elif file_format == "csv":
+        _write_csv(out, chunks)
+    else:
+        raise ValueError(f"Unknown export format '{file_format}'")
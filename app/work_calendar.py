@@ -0,0 +1,98 @@
+from collections import namedtuple
+from datetime import date, time
+
+import numpy as np
+
+# Saturday and Sunday (date.weekday() numbers)
+DEFAULT_WEEKEND = (5, 6)
+
+# Range covered by the prefix sums when the calendar is built; it grows on demand for dates outside
+DEFAULT_FIRST_YEAR = 2000
+DEFAULT_LAST_YEAR = 2099
+
+# Ordinal of 1970-01-01, to turn numpy datetime64 day numbers into date ordinals
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+def _seconds(t):
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+# Working hours of a role: shift start/end and the lunch break in between
+class Shift(namedtuple("Shift", "start end lunch_start lunch_end")):
+    __slots__ = ()
+
+    # Hours of the lunch break
+    @property
+    def lunch_hours(self):
+        return (_seconds(self.lunch_end) - _seconds(self.lunch_start)) / 3600.0
+
+    # Paid hours of a full day (shift without the lunch break)
+    @property
+    def hours(self):
+        return (_seconds(self.end) - _seconds(self.start)) / 3600.0 - self.lunch_hours
+
+    # Times a vacation can start or end at: every half hour from the shift start, and the shift end
+    def times(self, step_minutes=30):
+        seconds = range(_seconds(self.start), _seconds(self.end), step_minutes * 60)
+        return [time(second // 3600, second % 3600 // 60, second % 60) for second in seconds] + [self.end]
+
+DEFAULT_SHIFT = Shift(time(7, 30), time(16, 0), time(12, 0), time(12, 30))
+
+# Working days (weekends and holidays excluded) with prefix sums, so counting the working days
+# of any range is two array lookups. Also knows the shift of every role.
+class WorkCalendar:
+    def __init__(self, weekend=DEFAULT_WEEKEND, holidays=(), shifts=None):
+        self.weekend = frozenset(weekend)
+        self.holidays = frozenset(holidays)
+        self.shifts = dict(shifts or {})
+        self._table = self._build(date(DEFAULT_FIRST_YEAR, 1, 1).toordinal(), date(DEFAULT_LAST_YEAR, 12, 31).toordinal())
+
+    # (first ordinal, last ordinal, working flag per day, prefix sums with a leading 0)
+    def _build(self, first, last):
+        ordinals = np.arange(first, last + 1, dtype=np.int64)
+        working = ~np.isin((ordinals - 1) % 7, list(self.weekend))  # ordinal 1 is a Monday
+        holidays = [day.toordinal() - first for day in self.holidays if first <= day.toordinal() <= last]
+        working[np.array(holidays, dtype=np.int64)] = False
+        prefix = np.concatenate(([0], np.cumsum(working, dtype=np.int64)))
+        return first, last, working, prefix
+
+    # Table covering the given ordinals (rebuilt wider when needed; replaced in one assignment so readers never see half of it)
+    def _covering(self, first, last):
+        table = self._table
+        if first < table[0] or last > table[1]:
+            table = self._build(min(first, table[0]), max(last, table[1]))
+            self._table = table
+        return table
+
+    def shift(self, role):
+        return self.shifts.get(role, DEFAULT_SHIFT)
+
+    def is_working_day(self, day):
+        ordinal = day.toordinal()
+        first, _, working, _ = self._covering(ordinal, ordinal)
+        return bool(working[ordinal - first])
+
+    # Number of working days from start_date to end_date, both included (0 for an empty range)
+    def working_days(self, start_date, end_date):
+        start, end = start_date.toordinal(), end_date.toordinal()
+        if end < start:
+            return 0
+        first, _, _, prefix = self._covering(start, end)
+        return int(prefix[end - first + 1] - prefix[start - first])
+
+    # Vectorized is_working_day for an array of date ordinals
+    def is_working_batch(self, ordinals):
+        if len(ordinals) == 0:
+            return np.zeros(0, dtype=bool)
+        first, _, working, _ = self._covering(int(ordinals.min()), int(ordinals.max()))
+        return working[ordinals - first]
+
+    # Vectorized working_days for arrays of date ordinals (both ends included)
+    def working_days_batch(self, starts, ends):
+        if len(starts) == 0:
+            return np.zeros(0, dtype=np.int64)
+        ends = np.maximum(ends, starts - 1)
+        first, _, _, prefix = self._covering(int(starts.min()), int(ends.max()))
+        return prefix[ends - first + 1] - prefix[starts - first]
+
+# Calendar used when no calendar is given: Monday to Friday, no holidays, the default shift for all roles
+DEFAULT_CALENDAR = WorkCalendar()
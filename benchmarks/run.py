@@ -0,0 +1,163 @@
+# Benchmark suite on a synthetic database, results as JSON:
+#   python benchmarks/run.py --size medium --output results.json
+#   python benchmarks/run.py --size medium --compare results.json
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Dataset sizes: (users, vacations)
+SIZES = {
+    "small": (100, 10_000),
+    "medium": (10_000, 500_000),
+    "large": (100_000, 2_000_000),
+}
+
+def _git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(__file__), text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Run fn(i) `repeat` times with a fresh database session each time (like one Streamlit rerun) and return timings in ms
+def _measure(name, fn, repeat):
+    from app.database import session
+
+    timings = []
+    for i in range(repeat):
+        session.remove()
+        started = time.perf_counter()
+        fn(i)
+        timings.append((time.perf_counter() - started) * 1000)
+    session.remove()
+    result = {
+        "name": name,
+        "repeat": repeat,
+        "min_ms": round(min(timings), 4),
+        "median_ms": round(statistics.median(timings), 4),
+        "mean_ms": round(statistics.fmean(timings), 4),
+        "max_ms": round(max(timings), 4),
+    }
+    print(f"{name:<45} median {result['median_ms']:>12.3f} ms   min {result['min_ms']:>12.3f} ms", file=sys.stderr)
+    return result
+
+def run_benchmarks(repeat):
+    import numpy as np
+    from sqlalchemy.orm import joinedload
+
+    from app.database import (
+        session, User, Vacation, get_user, get_balance, compute_used_days,
+        load_vacation_requests, load_processed_vacations,
+    )
+    from app.services import calculate_used_vacation_days, calculate_remaining_vacation_days, check_vacation_limits, get_balances
+    from app.user_auth import login_user
+    from app.vacation_days import calculate_vacation_days, calculate_vacation_days_batch
+    from benchmarks.synthetic_data import BENCHMARK_PASSWORD, ADMIN_USERNAME
+
+    rng = np.random.default_rng(1)
+    users = session.query(User.id, User.username, User.role).filter(User.role != "Admin").all()
+    sample_users = [users[i] for i in rng.integers(0, len(users), size=max(repeat, 1))]
+    sample_vacations = session.query(Vacation.start_date, Vacation.end_date, Vacation.start_time, Vacation.end_time).limit(10_000).all()
+    start_dates, end_dates, start_times, end_times = (list(column) for column in zip(*sample_vacations))
+    session.remove()
+
+    results = []
+    def bench(name, fn, times=repeat):
+        results.append(_measure(name, fn, times))
+
+    bench(f"calculate_vacation_days x{len(sample_vacations)}",
+          lambda i: [calculate_vacation_days(*vacation) for vacation in sample_vacations])
+    bench(f"calculate_vacation_days_batch x{len(sample_vacations)}",
+          lambda i: calculate_vacation_days_batch(start_dates, end_dates, start_times, end_times))
+    bench("calculate_used_vacation_days (ledger)", lambda i: calculate_used_vacation_days(sample_users[i].id))
+    bench("calculate_used_vacation_days (recompute)", lambda i: compute_used_days(sample_users[i].id))
+    bench("calculate_remaining_vacation_days", lambda i: calculate_remaining_vacation_days(sample_users[i].id))
+    bench("get_balances (100 users, bulk API)", lambda i: get_balances([user.id for user in sample_users[:100]]))
+    bench("check_vacation_limits (2 weeks)", lambda i: check_vacation_limits(
+        sample_users[i].role, start_dates[i % len(start_dates)], start_dates[i % len(start_dates)] + timedelta(days=14)))
+    bench("login_user", lambda i: login_user(ADMIN_USERNAME, BENCHMARK_PASSWORD), times=min(repeat, 5))
+
+    # Data loading of each page, as done by app/main.py
+    bench("page: admin pending requests", lambda i: load_vacation_requests(), times=min(repeat, 5))
+    bench("page: admin processed requests (1st page)", lambda i: load_processed_vacations(20))
+    bench("page: admin users", lambda i: session.query(User).options(joinedload(User.balance)).all(), times=min(repeat, 5))
+    bench("page: user overview", lambda i: (
+        get_balance(get_user(sample_users[i].id)).remaining_days,
+        session.query(Vacation).filter_by(user_id=sample_users[i].id).all(),
+    ))
+    return results
+
+# Print the ratio to a previous result file for each benchmark with the same name
+def _compare(results, baseline_path):
+    with open(baseline_path) as baseline_file:
+        baseline = {result["name"]: result for result in json.load(baseline_file)["results"]}
+    for result in results:
+        previous = baseline.get(result["name"])
+        if previous and previous["median_ms"]:
+            ratio = result["median_ms"] / previous["median_ms"]
+            print(f"{result['name']:<45} {ratio:>8.2f}x  ({previous['median_ms']:.3f} -> {result['median_ms']:.3f} ms)", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the vacation manager on a synthetic SQLite database.")
+    parser.add_argument("--size", choices=SIZES, default="small", help="preset dataset size")
+    parser.add_argument("--users", type=int, help="number of users (overrides --size)")
+    parser.add_argument("--vacations", type=int, help="number of vacations (overrides --size)")
+    parser.add_argument("--database", help="scratch SQLite file (default: a file per size in the temp directory)")
+    parser.add_argument("--regenerate", action="store_true", help="rebuild the scratch database even if it exists")
+    parser.add_argument("--repeat", type=int, default=20, help="iterations per benchmark")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--compare", help="previous JSON results to compare against")
+    args = parser.parse_args()
+
+    users, vacations = SIZES[args.size]
+    users = args.users or users
+    vacations = args.vacations if args.vacations is not None else vacations
+    database = args.database or os.path.join(tempfile.gettempdir(), f"vacation_benchmark_{users}_{vacations}.db")
+
+    if args.regenerate and os.path.exists(database):
+        os.remove(database)
+    generate = not os.path.exists(database)
+
+    # Must be set before app.database creates its engine
+    os.environ["VACATION_MANAGER_DATABASE_URL"] = f"sqlite:///{database}"
+    from app.database import init_db
+    from benchmarks.synthetic_data import generate_dataset
+
+    if generate:
+        started = time.perf_counter()
+        generate_dataset(users, vacations)
+        print(f"Generated {users} users / {vacations} vacations in {time.perf_counter() - started:.1f} s", file=sys.stderr)
+    init_db()
+
+    report = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "users": users,
+            "vacations": vacations,
+            "database": database,
+        },
+        "results": run_benchmarks(args.repeat),
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+    if args.compare:
+        _compare(report["results"], args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+from datetime import date, time, timedelta
+
+import numpy as np
+from werkzeug.security import generate_password_hash
+
+from app.database import (
+    init_db, session, User, Vacation, Settings, reconcile_balances, rebuild_occupancy,
+)
+
+BENCHMARK_PASSWORD = "benchmark"
+ADMIN_USERNAME = "admin"
+INSERT_BATCH_SIZE = 20000
+
+# Share of users per role and of vacations per status
+ROLE_SHARES = {"Tourneur": 0.4, "Fraiseur": 0.3, "Soudeur": 0.3}
+STATUS_SHARES = {"approved": 0.75, "denied": 0.2, "pending": 0.05}
+
+# Half-hour grid the app offers for start/end times
+VALID_TIMES = [time(7, 30)] + [time(hour, minute) for hour in range(8, 16) for minute in (0, 30)] + [time(16, 0)]
+
+# Function to fill an empty database with users and vacations spread over `years` years
+def generate_dataset(users, vacations, years=3, seed=0):
+    rng = np.random.default_rng(seed)
+    init_db()
+
+    # Hashing is the slow part of creating users, so all of them share one password hash
+    hashed_password = generate_password_hash(BENCHMARK_PASSWORD, method='pbkdf2:sha256')
+    roles = rng.choice(list(ROLE_SHARES), size=users, p=list(ROLE_SHARES.values()))
+    vacation_days = rng.integers(20, 31, size=users)
+
+    session.execute(User.__table__.insert(), [{
+        "username": ADMIN_USERNAME, "email": "admin@example.com", "hashed_password": hashed_password,
+        "vacation_days": 0, "role": "Admin", "monthly_vacation_days": 0,
+    }])
+    for first in range(0, users, INSERT_BATCH_SIZE):
+        session.execute(User.__table__.insert(), [{
+            "username": f"user{i}",
+            "email": f"user{i}@example.com",
+            "hashed_password": hashed_password,
+            "vacation_days": int(vacation_days[i]),
+            "role": str(roles[i]),
+            "monthly_vacation_days": 2,
+        } for i in range(first, min(first + INSERT_BATCH_SIZE, users))])
+    session.commit()
+
+    user_ids = np.array([user_id for user_id, in session.query(User.id).filter(User.role != "Admin")])
+    first_day = date.today() - timedelta(days=365 * years)
+    statuses = list(STATUS_SHARES)
+    for first in range(0, vacations, INSERT_BATCH_SIZE):
+        count = min(INSERT_BATCH_SIZE, vacations - first)
+        owners = rng.choice(user_ids, size=count)
+        starts = rng.integers(0, 365 * years, size=count)
+        lengths = np.minimum(rng.geometric(0.35, size=count) - 1, 14)
+        start_slots = rng.integers(0, len(VALID_TIMES) - 1, size=count)
+        end_slots = np.where(
+            lengths == 0,
+            start_slots + 1 + (rng.integers(0, len(VALID_TIMES), size=count) % (len(VALID_TIMES) - 1 - start_slots)),
+            rng.integers(1, len(VALID_TIMES), size=count),
+        )
+        status_codes = rng.choice(len(statuses), size=count, p=list(STATUS_SHARES.values()))
+        session.execute(Vacation.__table__.insert(), [{
+            "user_id": int(owners[i]),
+            "start_date": first_day + timedelta(days=int(starts[i])),
+            "end_date": first_day + timedelta(days=int(starts[i] + lengths[i])),
+            "start_time": VALID_TIMES[start_slots[i]],
+            "end_time": VALID_TIMES[end_slots[i]],
+            "status": statuses[status_codes[i]],
+            "note": None,
+        } for i in range(count)])
+        session.commit()
+
+    session.add(Settings(dreher_limit=2, fraeser_limit=2, schweisser_limit=2))
+    session.commit()
+
+    # Derived tables are built the same way the maintenance command does it
+    reconcile_balances()
+    rebuild_occupancy()
@@ -0,0 +1,49 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from test_migrations import run_with_database
+
+# Credits on a scratch database: two users accruing 2 days a month from 20 days, one without monthly days.
+# Prints the months credited by each run and the final users, balances and accrual periods.
+ACCRUAL_RUNS = """
+from datetime import date
+from app.database import session, User, VacationBalance, AccrualPeriod
+from app.accrual import accrue_vacation_days
+from app.user_auth import register_user
+init_db()
+register_user("alice", "alice@example.com", "pw", 20.0, "Tourneur", 2.0)
+register_user("bob", "bob@example.com", "pw", 20.0, "Soudeur", 2.0)
+register_user("carol", "carol@example.com", "pw", 20.0, "Fraiseur", 0.0)
+runs = [
+    accrue_vacation_days(until=date(2024, 3, 15), since=date(2024, 1, 1)),
+    accrue_vacation_days(until=date(2024, 3, 31)),
+    accrue_vacation_days(until=date(2024, 6, 1)),
+    accrue_vacation_days(until=date(2024, 6, 30)),
+]
+session.remove()
+print(json.dumps({
+    "runs": [[month.isoformat() for month in months] for months in runs],
+    "vacation_days": {user.username: user.vacation_days for user in session.query(User)},
+    "remaining_days": {user.username: user.balance.remaining_days for user in session.query(User)},
+    "periods": [(period.period.isoformat(), period.users) for period in session.query(AccrualPeriod).order_by(AccrualPeriod.period)],
+    "drift": reconcile_balances(fix=False),
+}))
+"""
+
+def test_accrual_is_idempotent_and_catches_up(tmp_path):
+    result = run_with_database(tmp_path / "accrual.db", ACCRUAL_RUNS)
+
+    # January to March on the first run, nothing again for March, then the missed April and May with June
+    assert result["runs"] == [
+        ["2024-01-01", "2024-02-01", "2024-03-01"],
+        [],
+        ["2024-04-01", "2024-05-01", "2024-06-01"],
+        [],
+    ]
+    # Six months of 2 days, each credited once
+    assert result["vacation_days"] == {"alice": 32.0, "bob": 32.0, "carol": 20.0}
+    assert result["remaining_days"] == {"alice": 32.0, "bob": 32.0, "carol": 20.0}
+    assert result["periods"] == [[f"2024-0{month}-01", 2] for month in range(1, 7)]
+    assert result["drift"] == []
@@ -0,0 +1,70 @@
+import sys
+import os
+import json
+import shutil
+import sqlite3
+import subprocess
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.migrations import MIGRATIONS
+
+REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SHIPPED_DATABASE = os.path.join(REPO, 'vacation_manager.db')
+
+# app.database binds its engine when it is imported, so every upgrade runs in its own interpreter.
+# Returns the JSON printed last by the code.
+def run_with_database(path, code):
+    result = subprocess.run(
+        [sys.executable, "-c", "import json\nfrom app.database import init_db, reconcile_balances\n" + code],
+        cwd=REPO,
+        env={**os.environ, "VACATION_MANAGER_DATABASE_URL": f"sqlite:///{path}"},
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def run_init_db(path):
+    return [tuple(step) for step in run_with_database(path, "print(json.dumps(init_db()))")]
+
+# Copy of the shipped database as it was before migrations existed (version 0), with one approved vacation
+def version_0_copy(tmp_path):
+    path = tmp_path / "vacation_manager.db"
+    shutil.copy(SHIPPED_DATABASE, path)
+    with sqlite3.connect(path) as connection:
+        connection.execute("PRAGMA user_version = 0")
+        user_id = connection.execute("SELECT id FROM users WHERE role != 'Admin' ORDER BY id").fetchone()[0]
+        connection.execute(
+            "INSERT INTO vacations (user_id, start_date, end_date, start_time, end_time, status, note) "
+            "VALUES (?, '2024-03-04', '2024-03-08', '07:30:00.000000', '16:00:00.000000', 'approved', NULL)",
+            (user_id,),
+        )
+    return path, user_id
+
+def test_upgrade_shipped_database_from_version_0(tmp_path):
+    path, user_id = version_0_copy(tmp_path)
+
+    applied = run_init_db(path)
+    assert [version for version, _ in applied] == [version for version, _, _ in MIGRATIONS]
+
+    with sqlite3.connect(path) as connection:
+        assert connection.execute("PRAGMA user_version").fetchone()[0] == MIGRATIONS[-1][0]
+        assert "token_version" in [row[1] for row in connection.execute("PRAGMA table_info(users)")]
+        users = connection.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        assert connection.execute("SELECT COUNT(*) FROM vacation_balances").fetchone()[0] == users
+        assert connection.execute("SELECT COUNT(*) FROM balance_snapshots").fetchone()[0] == users
+        # Monday to Friday, full days
+        assert connection.execute("SELECT used_days FROM vacation_balances WHERE user_id = ?", (user_id,)).fetchone()[0] == 5.0
+        triggers = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+        assert {"vacations_generation_insert", "vacations_generation_update", "vacations_generation_delete"} <= triggers
+
+    # Nothing left to apply the second time, and the balances match the vacations
+    assert run_init_db(path) == []
+    assert run_with_database(path, "print(json.dumps(reconcile_balances(fix=False)))") == []
+
+def test_fresh_database(tmp_path):
+    path = tmp_path / "fresh.db"
+    assert [version for version, _ in run_init_db(path)] == [version for version, _, _ in MIGRATIONS]
+    assert run_init_db(path) == []
@@ -0,0 +1,118 @@
+import sys
+import os
+from datetime import date, time, timedelta
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.vacation_days import calculate_vacation_days, calculate_vacation_days_batch
+from app.work_calendar import WorkCalendar, Shift, DEFAULT_CALENDAR
+
+ROLES = ["Tourneur", "Fraiseur", "Soudeur", "Admin", None]
+
+# Half days start or end at the lunch break, so both lunch edges are always in the samples
+TIMES = [time(7, 30), time(8, 0), time(10, 15), time(12, 0), time(12, 30), time(13, 0), time(15, 45), time(16, 0), time(6, 0), time(18, 0)]
+
+HOLIDAYS = [date(2024, 1, 1), date(2024, 5, 1), date(2024, 5, 9), date(2024, 12, 25), date(2024, 12, 26), date(2025, 1, 1)]
+
+CALENDARS = {
+    "default": DEFAULT_CALENDAR,
+    "holidays": WorkCalendar(holidays=HOLIDAYS),
+    "shifts": WorkCalendar(
+        weekend=(4, 5, 6),
+        holidays=HOLIDAYS,
+        shifts={
+            "Tourneur": Shift(time(6, 0), time(14, 0), time(10, 0), time(10, 30)),
+            "Soudeur": Shift(time(14, 0), time(22, 0), time(18, 0), time(18, 45)),
+            "Fraiseur": Shift(time(8, 0), time(17, 0), time(12, 0), time(13, 0)),
+        },
+    ),
+}
+
+# Random vacations: (start date, end date, start time, end time, role)
+def random_vacations(count, seed):
+    rng = np.random.default_rng(seed)
+    starts = [date(2023, 11, 1) + timedelta(days=int(offset)) for offset in rng.integers(0, 500, count)]
+    lengths = rng.choice([0, 0, 0, 1, 2, 4, 7, 13, 30, 90], count)
+    return [
+        (start, start + timedelta(days=int(length)), TIMES[start_index], TIMES[end_index], ROLES[role_index])
+        for start, length, start_index, end_index, role_index in zip(
+            starts, lengths, rng.integers(0, len(TIMES), count), rng.integers(0, len(TIMES), count), rng.integers(0, len(ROLES), count)
+        )
+    ]
+
+@pytest.mark.parametrize("name", sorted(CALENDARS))
+def test_batch_matches_scalar(name):
+    calendar = CALENDARS[name]
+    vacations = random_vacations(5000, seed=len(name))
+    start_dates, end_dates, start_times, end_times, roles = (list(column) for column in zip(*vacations))
+
+    expected = [calculate_vacation_days(*vacation[:4], calendar=calendar, role=vacation[4]) for vacation in vacations]
+    actual = calculate_vacation_days_batch(start_dates, end_dates, start_times, end_times, calendar, roles)
+
+    mismatches = [(vacation, e, a) for vacation, e, a in zip(vacations, expected, actual) if e != a]
+    assert not mismatches, mismatches[:5]
+
+@pytest.mark.parametrize("name", sorted(CALENDARS))
+def test_batch_without_roles_uses_default_shift(name):
+    calendar = CALENDARS[name]
+    vacations = random_vacations(1000, seed=7)
+    start_dates, end_dates, start_times, end_times, _ = (list(column) for column in zip(*vacations))
+
+    expected = [calculate_vacation_days(*vacation[:4], calendar=calendar) for vacation in vacations]
+    actual = calculate_vacation_days_batch(start_dates, end_dates, start_times, end_times, calendar)
+    assert list(actual) == expected
+
+# Missing times in the batch mean the whole shift of the role
+def test_batch_missing_times_default_to_shift():
+    calendar = CALENDARS["shifts"]
+    vacations = random_vacations(1000, seed=3)
+    start_dates, end_dates, _, _, roles = (list(column) for column in zip(*vacations))
+
+    expected = [
+        calculate_vacation_days(start, end, calendar.shift(role).start, calendar.shift(role).end, calendar=calendar, role=role)
+        for start, end, _, _, role in vacations
+    ]
+    actual = calculate_vacation_days_batch(start_dates, end_dates, [None] * len(vacations), [None] * len(vacations), calendar, roles)
+    assert list(actual) == expected
+
+# NumPy inputs (datetime64 days, seconds since midnight) give the same results as Python objects
+def test_batch_accepts_numpy_arrays():
+    calendar = CALENDARS["holidays"]
+    vacations = random_vacations(1000, seed=11)
+    start_dates, end_dates, start_times, end_times, roles = (list(column) for column in zip(*vacations))
+
+    seconds = lambda times: np.array([t.hour * 3600 + t.minute * 60 for t in times])
+    from_objects = calculate_vacation_days_batch(start_dates, end_dates, start_times, end_times, calendar, roles)
+    from_arrays = calculate_vacation_days_batch(
+        np.array(start_dates, dtype='datetime64[D]'), np.array(end_dates, dtype='datetime64[D]'),
+        seconds(start_times), seconds(end_times), calendar, roles,
+    )
+    assert list(from_arrays) == list(from_objects)
+
+def test_holidays_and_weekends_are_not_counted():
+    calendar = CALENDARS["holidays"]
+    # Wednesday 1 May 2024 is a holiday, Saturday/Sunday 4-5 May are weekend
+    assert calculate_vacation_days(date(2024, 5, 1), date(2024, 5, 1), time(7, 30), time(16, 0), calendar=calendar) == 0.0
+    assert calculate_vacation_days(date(2024, 4, 29), date(2024, 5, 5), time(7, 30), time(16, 0), calendar=calendar) == 4.0
+    assert list(calculate_vacation_days_batch([date(2024, 4, 29)], [date(2024, 5, 5)], [time(7, 30)], [time(16, 0)], calendar)) == [4.0]
+
+# Calendar table grows for dates outside the prebuilt range
+def test_dates_outside_prebuilt_range():
+    calendar = WorkCalendar(holidays=[date(1990, 1, 1)])
+    vacations = [(date(1989, 12, 20), date(1990, 1, 10), time(7, 30), time(16, 0)), (date(2105, 3, 1), date(2105, 3, 31), time(12, 30), time(12, 0))]
+    expected = [calculate_vacation_days(*vacation, calendar=calendar) for vacation in vacations]
+    actual = calculate_vacation_days_batch(*(list(column) for column in zip(*vacations)), calendar)
+    assert list(actual) == expected
+
+# The request form offers the half-hour grid of the role's shift; a full day on it is one day
+def test_shift_times_cover_the_shift():
+    calendar = CALENDARS["shifts"]
+    times = calendar.shift("Soudeur").times()
+    assert times[0] == time(14, 0) and times[-1] == time(22, 0) and len(times) == 17
+    assert calendar.shift("Admin").times()[0] == time(7, 30)
+    for role in ROLES:
+        shift = calendar.shift(role)
+        assert calculate_vacation_days(date(2024, 6, 3), date(2024, 6, 3), shift.times()[0], shift.times()[-1], calendar=calendar, role=role) == 1.0